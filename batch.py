@@ -0,0 +1,115 @@
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from chat import AgentRuntime
+from metrics import metrics
+
+
+def read_questions(path):
+    questions = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            if path.endswith('.jsonl'):
+                record = json.loads(line)
+                questions.append((record.get('id', len(questions)), record['question']))
+            else:
+                questions.append((len(questions), line))
+    return questions
+
+
+async def answer_question(runtime, question_id, question, include_rows=False):
+    record = {"id": question_id, "question": question, "node_timings": {}, "error": None}
+    state = {}
+    started = time.perf_counter()
+    try:
+        async for event in runtime.astream(question):
+            if event["type"] == "step":
+                record["node_timings"][event["node"]] = round(event["elapsed"], 4)
+                state.update(event["payload"])
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+    record["elapsed"] = round(time.perf_counter() - started, 4)
+    record["template_hit"] = state.get("template_hit", False)
+    record["sql"] = state.get("query")
+    record["result"] = state.get("result")
+    record["row_counts"] = [r.get("row_count") for r in state.get("results", []) if "error" not in r]
+    # Statement failures (timeouts, syntax, read-only) come back as results,
+    # not exceptions; a question with any of them counts as failed.
+    record["statement_errors"] = [
+        {"statement": i, "kind": r.get("kind"), "error": r["error"]}
+        for i, r in enumerate(state.get("results", []), 1) if "error" in r
+    ]
+    if record["error"] is None and record["statement_errors"]:
+        record["error"] = "; ".join(f"Query {e['statement']} failed ({e['kind']}): {e['error']}"
+                                    for e in record["statement_errors"])
+    if include_rows:
+        record["rows"] = [
+            {"columns": r["columns"], "rows": [list(row) for row in r["rows"]]}
+            for r in state.get("results", []) if "error" not in r
+        ]
+    record["answer"] = state.get("answer")
+    return record
+
+
+async def run_batch(runtime, questions, output, concurrency, include_rows=False):
+    semaphore = asyncio.Semaphore(concurrency)
+    completed = 0
+    failed = 0
+
+    async def worker(question_id, question):
+        async with semaphore:
+            return await answer_question(runtime, question_id, question, include_rows=include_rows)
+
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(worker(qid, q)) for qid, q in questions]
+    for task in asyncio.as_completed(tasks):
+        record = await task
+        output.write(json.dumps(record, default=str) + "\n")
+        output.flush()
+        completed += 1
+        if record["error"]:
+            failed += 1
+        if completed % 10 == 0 or completed == len(tasks):
+            print(f"Processed {completed}/{len(tasks)} questions (failed: {failed})", file=sys.stderr)
+    elapsed = time.perf_counter() - started
+    return completed, failed, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Answer a file of questions with the ReAct SQL agent.")
+    parser.add_argument('questions', help='Text file with one question per line, or JSONL with a "question" field')
+    parser.add_argument('-o', '--output', default='batch_results.jsonl', help='JSONL file to write results to ("-" for stdout)')
+    parser.add_argument('-c', '--concurrency', type=int, default=4, help='Maximum number of questions in flight')
+    parser.add_argument('--include-rows', action='store_true', help='Also write the full result rows of each query')
+    parser.add_argument('--metrics-out', help='Write per-node/tool histograms in Prometheus text format to this file')
+    args = parser.parse_args()
+
+    concurrency = max(1, args.concurrency)
+    runtime = AgentRuntime(sessions=concurrency)
+    if not runtime.ollama.ensure_ready():
+        print(f"Ollama is not ready: {runtime.ollama.error}", file=sys.stderr)
+        sys.exit(1)
+
+    questions = read_questions(args.questions)
+    output = sys.stdout if args.output == '-' else open(args.output, 'w')
+    try:
+        completed, failed, elapsed = asyncio.run(
+            run_batch(runtime, questions, output, concurrency, include_rows=args.include_rows)
+        )
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+    if args.metrics_out:
+        with open(args.metrics_out, 'w') as f:
+            f.write(metrics.prometheus_text())
+
+    throughput = completed / elapsed if elapsed else 0.0
+    print(f"Answered {completed} questions ({failed} failed) in {elapsed:.1f}s "
+          f"with concurrency {args.concurrency}: {throughput:.2f} questions/s", file=sys.stderr)
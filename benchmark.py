@@ -0,0 +1,277 @@
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+import chat
+from metrics import metrics
+
+NODES = ["match_template", "reason_and_plan", "validate_and_refine", "execute_final_query", "generate_final_answer"]
+
+
+def load_cases(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _prompt_field(text: str, label: str) -> str:
+    for line in text.splitlines():
+        if line.startswith(f"{label}: "):
+            return line[len(label) + 2:].strip()
+    return ""
+
+
+class StandInChatModel(BaseChatModel):
+    # Answers from the golden cases instead of a real model, so the whole
+    # graph (prompts, DB pipeline, caches) can be timed offline.
+    reference_sql: dict
+
+    @property
+    def _llm_type(self) -> str:
+        return "golden-stand-in"
+
+    def _respond(self, text: str) -> str:
+        if "Query Result:" in text:
+            return f"<think>Reading the result.</think>The result is {_prompt_field(text, 'Query Result')}."
+        question = _prompt_field(text, "Question")
+        query = self.reference_sql.get(question, "")
+        return json.dumps({"reasoning": "Looked up the reference query.", "query": query})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        prompt = "\n".join(str(message.content) for message in messages)
+        content = self._respond(messages[-1].content)
+        usage = {
+            "input_tokens": len(prompt) // 4,
+            "output_tokens": len(content) // 4,
+            "total_tokens": len(prompt) // 4 + len(content) // 4,
+        }
+        message = AIMessage(content=content, usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+class NodeTokenUsage(BaseCallbackHandler):
+    def __init__(self):
+        self.run_nodes = {}
+        self.usage = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self.run_nodes[run_id] = (metadata or {}).get("langgraph_node", "unknown")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        node = self.run_nodes.pop(run_id, "unknown")
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                totals = self.usage.setdefault(node, {"prompt_tokens": 0, "completion_tokens": 0})
+                totals["prompt_tokens"] += usage.get("input_tokens", 0)
+                totals["completion_tokens"] += usage.get("output_tokens", 0)
+
+
+def normalize_rows(rows):
+    normalized = []
+    for row in rows:
+        normalized.append(tuple(round(value, 4) if isinstance(value, float) else value for value in row))
+    return sorted(normalized, key=repr)
+
+
+def statement_results(runtime, sql: str):
+    # Normalized rows of each statement, None for a statement that failed.
+    results = []
+    for statement in chat.split_statements(sql or ""):
+        try:
+            columns, rows = runtime.query_pipeline.run(statement)
+        except Exception:
+            results.append(None)
+            continue
+        results.append(normalize_rows(rows))
+    return results
+
+
+def result_matches(predicted, reference) -> bool:
+    # Every reference statement's result must come back from some predicted
+    # statement, in any order.
+    if all(expected in predicted for expected in reference):
+        return True
+    # A multi-part question answered with one single-row statement per part,
+    # as the system prompt asks, against a reference that selects every part
+    # in one row.
+    if len(reference) == 1 and len(predicted) > 1 and all(rows is not None and len(rows) == 1 for rows in predicted):
+        return normalize_rows([tuple(value for rows in predicted for value in rows[0])]) == reference[0]
+    return False
+
+
+def run_case(runtime, case):
+    usage = NodeTokenUsage()
+    timings = {}
+    state = {}
+    error = None
+    started = time.perf_counter()
+    last_event = started
+    try:
+        for step in runtime.graph.stream(
+            chat.initial_state(case["question"]),
+            config={"callbacks": [usage]},
+            stream_mode="updates",
+        ):
+            now = time.perf_counter()
+            for node_name, node_output in step.items():
+                timings[node_name] = now - last_event
+                state.update(node_output or {})
+            last_event = now
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    elapsed = time.perf_counter() - started
+
+    match = False
+    if error is None:
+        try:
+            reference = [normalize_rows(runtime.query_pipeline.run(statement)[1])
+                         for statement in chat.split_statements(case["sql"])]
+        except Exception as e:
+            error = f"Reference query failed: {type(e).__name__}: {e}"
+        else:
+            match = result_matches(statement_results(runtime, state.get("query")), reference)
+    return {
+        "id": case["id"],
+        "question": case["question"],
+        "reference_sql": case["sql"],
+        "predicted_sql": state.get("query"),
+        "match": match,
+        "template_hit": state.get("template_hit", False),
+        "elapsed": elapsed,
+        "node_latency": timings,
+        "tokens": usage.usage,
+        "error": error,
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def reasoning_parse_counts():
+    return {
+        counter["labels"]["method"]: counter["value"]
+        for counter in metrics.snapshot()["counters"]
+        if counter["name"] == "agent_reasoning_parse_total"
+    }
+
+
+def summarize(cases):
+    parses = reasoning_parse_counts()
+    parsed = sum(parses.values())
+    summary = {
+        "cases": len(cases),
+        "accuracy": sum(case["match"] for case in cases) / len(cases) if cases else 0.0,
+        "errors": sum(case["error"] is not None for case in cases),
+        "total_latency": {
+            "mean": statistics.mean(case["elapsed"] for case in cases),
+            "p50": percentile([case["elapsed"] for case in cases], 0.5),
+            "p95": percentile([case["elapsed"] for case in cases], 0.95),
+        },
+        "node_latency": {},
+        "tokens": {"prompt_tokens": 0, "completion_tokens": 0},
+        "reasoning_parse": parses,
+        "reasoning_fallback_rate": (parsed - parses.get("json", 0)) / parsed if parsed else 0.0,
+    }
+    for node in NODES:
+        values = [case["node_latency"][node] for case in cases if node in case["node_latency"]]
+        if values:
+            summary["node_latency"][node] = {
+                "runs": len(values),
+                "mean": statistics.mean(values),
+                "p50": percentile(values, 0.5),
+                "p95": percentile(values, 0.95),
+            }
+    for case in cases:
+        for usage in case["tokens"].values():
+            summary["tokens"]["prompt_tokens"] += usage["prompt_tokens"]
+            summary["tokens"]["completion_tokens"] += usage["completion_tokens"]
+    return summary
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def print_report(summary, baseline=None):
+    def delta(current, previous):
+        if previous is None:
+            return ""
+        return f" ({current - previous:+.3f})"
+
+    base = baseline["summary"] if baseline else {}
+    print(f"Accuracy: {summary['accuracy']:.1%} over {summary['cases']} cases"
+          f"{delta(summary['accuracy'], base.get('accuracy'))}")
+    total = summary["total_latency"]
+    print(f"Total latency: mean {total['mean']:.3f}s, p50 {total['p50']:.3f}s, p95 {total['p95']:.3f}s"
+          f"{delta(total['p95'], base.get('total_latency', {}).get('p95'))}")
+    for node, stats in summary["node_latency"].items():
+        previous = base.get("node_latency", {}).get(node, {}).get("p95")
+        print(f"  {node:<24} runs {stats['runs']:>3}  mean {stats['mean']:.3f}s  "
+              f"p50 {stats['p50']:.3f}s  p95 {stats['p95']:.3f}s{delta(stats['p95'], previous)}")
+    tokens = summary["tokens"]
+    print(f"Tokens: {tokens['prompt_tokens']} prompt, {tokens['completion_tokens']} completion")
+    print(f"Reasoning output repaired locally: {summary['reasoning_fallback_rate']:.1%}"
+          f"{delta(summary['reasoning_fallback_rate'], base.get('reasoning_fallback_rate'))}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Run the golden-question benchmark against the agent graph.")
+    parser.add_argument('--cases', default='benchmarks/golden_questions.jsonl', help='JSONL file of golden questions')
+    parser.add_argument('--llm', choices=['ollama', 'stand-in'], default='ollama',
+                        help='Use the configured Ollama model, or an offline stand-in that replays the reference SQL')
+    parser.add_argument('-o', '--output', default='benchmark_report.json', help='Where to write the JSON report')
+    parser.add_argument('--compare', help='Previous report to print deltas against')
+    parser.add_argument('--min-accuracy', type=float, default=None, help='Exit non-zero below this accuracy')
+    args = parser.parse_args()
+
+    cases = load_cases(args.cases)
+    if args.llm == 'stand-in':
+        runtime = chat.AgentRuntime(llm=StandInChatModel(reference_sql={case["question"]: case["sql"] for case in cases}))
+    else:
+        runtime = chat.AgentRuntime()
+        if not runtime.ollama.ensure_ready():
+            print(f"Ollama is not ready: {runtime.ollama.error}", file=sys.stderr)
+            sys.exit(1)
+
+    results = []
+    for case in cases:
+        result = run_case(runtime, case)
+        results.append(result)
+        status = "ok  " if result["match"] else "FAIL"
+        print(f"[{status}] {case['id']:<24} {result['elapsed']:.3f}s", file=sys.stderr)
+
+    summary = summarize(results)
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "git_revision": git_revision(),
+        "llm": args.llm if args.llm == 'stand-in' else runtime.ollama.model,
+        "database": runtime.db_uri,
+        "summary": summary,
+        "cases": results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, default=str)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_report(summary, baseline)
+
+    if args.min_accuracy is not None and summary["accuracy"] < args.min_accuracy:
+        sys.exit(1)
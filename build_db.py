@@ -6,6 +6,18 @@ import pandas as pd
 from requests.exceptions import ConnectionError
 from riotwatcher import LolWatcher, ApiError
 
+# Apex tiers have a single division (I); the ordinal still leaves room for
+# IV..I so lower tiers slot in if the builder is ever pointed at them.
+TIER_ORDER = ['IRON', 'BRONZE', 'SILVER', 'GOLD', 'PLATINUM', 'EMERALD', 'DIAMOND',
+              'MASTER', 'GRANDMASTER', 'CHALLENGER']
+DIVISION_ORDER = ['IV', 'III', 'II', 'I']
+DERIVED_COLUMN_TYPES = {'total_games': 'INTEGER', 'winrate': 'REAL', 'rank_ordinal': 'INTEGER'}
+DERIVED_INDEXES = {
+    'ix_league_players_winrate': ['winrate'],
+    'ix_league_players_total_games': ['total_games'],
+    'ix_league_players_rank_ordinal': ['rank_ordinal', 'leaguePoints'],
+}
+
 class LolInterface:
     def __init__(self, api_key):
         self.api_key = api_key
@@ -48,6 +60,7 @@ def get_top_players(region, testing=False):
     league_entries = []
     for division in all_top_players:
         for entry in division['entries']:
+            entry['tier'] = division['tier']
             summoner_ids.append(entry['summonerId'])
             league_entries.append(entry)
     return summoner_ids, league_entries
@@ -461,6 +474,53 @@ def df_to_sql(df, database='data/matches.db', table_name='player_items_champions
     conn = sqlite3.connect(database)
     df.to_sql(name="player_items_champions", con=conn, if_exists='append', index=False)
 
+def rank_ordinal(tier, rank):
+    if tier not in TIER_ORDER:
+        return None
+    division = DIVISION_ORDER.index(rank) if rank in DIVISION_ORDER else len(DIVISION_ORDER) - 1
+    return TIER_ORDER.index(tier) * len(DIVISION_ORDER) + division
+
+def add_derived_columns(df):
+    # Materialized so winrate and games-played questions filter on an
+    # indexed column instead of computing the expression for every row.
+    if 'wins' in df.columns and 'losses' in df.columns:
+        df['total_games'] = df['wins'] + df['losses']
+        # Unrounded, so filters and averages on it match wins * 100.0 / (wins + losses) exactly.
+        df['winrate'] = df['wins'] * 100.0 / df['total_games'].where(df['total_games'] > 0)
+    if 'tier' in df.columns:
+        ranks = df['rank'] if 'rank' in df.columns else [None] * len(df)
+        df['rank_ordinal'] = [rank_ordinal(tier, rank) for tier, rank in zip(df['tier'], ranks)]
+    return df
+
+def create_derived_indexes(conn, table_name='league_players'):
+    columns = {row[1] for row in conn.execute(f'PRAGMA table_info("{table_name}")')}
+    for name, index_columns in DERIVED_INDEXES.items():
+        if all(column in columns for column in index_columns):
+            column_list = ", ".join(f'"{column}"' for column in index_columns)
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{name}" ON "{table_name}" ({column_list})')
+    conn.commit()
+
+def add_derived_columns_to_database(database='league_players.db'):
+    # Updated in place: replacing the table would drop its indexes, including
+    # any created by index_advisor.py --apply.
+    conn = sqlite3.connect(database)
+    df = pd.read_sql('SELECT rowid AS "_rowid", * FROM league_players', conn)
+    existing = set(df.columns)
+    df = add_derived_columns(df)
+    derived = [column for column in DERIVED_COLUMN_TYPES if column in df.columns]
+    for column in derived:
+        if column not in existing:
+            conn.execute(f'ALTER TABLE league_players ADD COLUMN "{column}" {DERIVED_COLUMN_TYPES[column]}')
+    if derived:
+        values = df[derived + ['_rowid']].astype(object)
+        assignments = ", ".join(f'"{column}" = ?' for column in derived)
+        conn.executemany(f'UPDATE league_players SET {assignments} WHERE rowid = ?',
+                         values.where(values.notna(), None).values.tolist())
+    create_derived_indexes(conn)
+    conn.close()
+    print(f"Added derived columns to {len(df)} league players in database: {database}")
+    return df
+
 def build_comprehensive_database(league_entries, summoner_profiles, match_data_rows, player_data_rows, team_data_rows, 
                                 champion_statistics=None, champion_bans=None, match_statistics=None, 
                                 team_performance_stats=None, objective_statistics=None, item_statistics=None, 
@@ -468,8 +528,9 @@ def build_comprehensive_database(league_entries, summoner_profiles, match_data_r
                                 database='league_players.db'):
     conn = sqlite3.connect(database)
     
-    league_df = pd.DataFrame(league_entries)
+    league_df = add_derived_columns(pd.DataFrame(league_entries))
     league_df.to_sql(name="league_players", con=conn, if_exists='replace', index=False)
+    create_derived_indexes(conn)
     print(f"✅ League players table: {len(league_entries)} entries")
     
     if summoner_profiles:
@@ -571,13 +632,16 @@ def build_league_database(league_entries, database='league_players.db'):
             player_data['freshBlood'] = entry['freshBlood']
         if 'inactive' in entry:
             player_data['inactive'] = entry['inactive']
+        if 'tier' in entry:
+            player_data['tier'] = entry['tier']
         
         data_rows.append(player_data)
     
-    df = pd.DataFrame(data_rows)
+    df = add_derived_columns(pd.DataFrame(data_rows))
     
     conn = sqlite3.connect(database)
     df.to_sql(name="league_players", con=conn, if_exists='replace', index=False)
+    create_derived_indexes(conn)
     conn.close()
     
     print(f"Successfully stored {len(data_rows)} league players in database: {database}")
@@ -1148,15 +1212,22 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     key_help = "Riot Developer API key, found at https://developer.riotgames.com"
     region_help = "Region to query data for. Supported values can be found at https://developer.riotgames.com/docs/lol"
-    parser.add_argument('-k', '--key', required=True, help=key_help)
-    parser.add_argument('-r', '--region', required=True, help=region_help)
+    parser.add_argument('-k', '--key', help=key_help)
+    parser.add_argument('-r', '--region', help=region_help)
     parser.add_argument('-t', '--testing', action='store_true', help='Run in testing mode with only challenger players')
     parser.add_argument('--max-players', type=int, default=None, help='Maximum number of players to process (for testing)')
     parser.add_argument('--league-only', action='store_true', help='Only build league database (no individual summoner data)')
     parser.add_argument('--comprehensive', action='store_true', help='Build comprehensive database with all available data')
     parser.add_argument('--enhanced', action='store_true', help='Collect enhanced statistics including champion, item, rune, and match statistics')
+    parser.add_argument('--derive-only', action='store_true', help='Add derived columns and their indexes to an existing league_players.db without calling the API')
     args = parser.parse_args()
 
+    if args.derive_only:
+        add_derived_columns_to_database()
+        raise SystemExit(0)
+    if not args.key or not args.region:
+        parser.error("--key and --region are required unless --derive-only is given")
+
     api_key = args.key
     region = args.region
     lol_obj = LolInterface(api_key=api_key)
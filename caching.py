@@ -0,0 +1,349 @@
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from sqlalchemy.engine import make_url
+
+from metrics import record_cache
+
+
+class DatabaseWatcher:
+    def __init__(self, db_uri: str, poll_ttl: float = 30.0):
+        url = make_url(db_uri)
+        self.dialect = url.get_backend_name()
+        self.path = url.database if self.dialect == 'sqlite' else None
+        self.poll_ttl = poll_ttl
+        self._conn = None
+        self._identity = None
+        self._lock = threading.Lock()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+            self._conn = self._identity = None
+
+    def _watchable(self):
+        return self.path not in (None, '', ':memory:')
+
+    def _connection(self, identity):
+        # A file swapped in by rename gets a new inode; the old connection
+        # would keep reading the unlinked file, so reopen against the new one.
+        if self._conn is None or identity != self._identity:
+            if self._conn is not None:
+                self._conn.close()
+            uri = Path(self.path).resolve().as_uri() + "?mode=ro"
+            self._conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            self._identity = identity
+        return self._conn
+
+    def _read(self):
+        if not self._watchable():
+            return ('ttl', int(time.monotonic() // self.poll_ttl)), None
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return ('missing', self.path), None
+        identity = (st.st_dev, st.st_ino)
+        with self._lock:
+            conn = self._connection(identity)
+            schema_version = conn.execute("PRAGMA schema_version").fetchone()[0]
+            data_version = conn.execute("PRAGMA data_version").fetchone()[0]
+        return identity + (schema_version,), data_version
+
+    def schema_version(self):
+        return self._read()[0]
+
+    def version(self):
+        schema_version, data_version = self._read()
+        return schema_version + (data_version,)
+
+
+class SchemaCache:
+    def __init__(self, db_factory, watcher: DatabaseWatcher):
+        self.db_factory = db_factory
+        self.watcher = watcher
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        self._schema_version = watcher.schema_version()
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+
+    @property
+    def db(self):
+        # Reflection reads every table's metadata, so it waits until a
+        # description is first needed.
+        with self._db_lock:
+            if self._db is None:
+                self._db = self.db_factory()
+            return self._db
+
+    def _refresh(self, schema_version):
+        # SQLDatabase reflects tables once at construction, so a schema change
+        # needs a fresh instance, not just a fresh description.
+        if schema_version != self._schema_version:
+            with self._db_lock:
+                self._db = None
+            self._schema_version = schema_version
+            self._entries.clear()
+
+    def get(self, key, build) -> str:
+        version = self.watcher.version()
+        schema_version = version[:-1]
+        with self._lock:
+            self._refresh(schema_version)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.hits += 1
+                record_cache("schema", True)
+                return entry[1]
+            self.misses += 1
+            record_cache("schema", False)
+            db = self.db
+        description = build(db)
+        with self._lock:
+            self._entries = {k: v for k, v in self._entries.items() if v[0] == version}
+            self._entries[key] = (version, description)
+        return description
+
+    def get_table_info(self, table_names=None) -> str:
+        key = tuple(sorted(table_names)) if table_names else None
+        return self.get(key, lambda db: db.get_table_info(list(key) if key else None))
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+QUESTION_NUMBER = re.compile(r'(?<![\w.])\d+(?:\.\d+)?(?![\w.])')
+SQL_TOKEN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+
+
+def normalize_question(question: str):
+    text = re.sub(r'\s+', ' ', question.strip().lower()).rstrip('?.! ')
+    values = [float(m) for m in QUESTION_NUMBER.findall(text)]
+    return QUESTION_NUMBER.sub('{}', text), values
+
+
+def _format_number(value: float, like: str) -> str:
+    if '.' not in like and value.is_integer():
+        return str(int(value))
+    text = f"{value:.10f}".rstrip('0')
+    return text + '0' if text.endswith('.') else text
+
+
+def build_template(question_values, sql: str):
+    segments = []
+    slots = []
+    used = set()
+    position = 0
+    for match in SQL_TOKEN.finditer(sql):
+        literal = match.group()
+        if literal[0] in '\'"':
+            continue
+        value = float(literal)
+        candidates = []
+        for i, q in enumerate(question_values):
+            if value == q:
+                candidates.append((i, 'raw'))
+            elif abs(value - q / 100) < 1e-12:
+                candidates.append((i, 'percent'))
+        if not candidates:
+            continue
+        if len(candidates) > 1:
+            return None
+        index, transform = candidates[0]
+        if index in used:
+            # The same question value feeding two literals is as likely to be a
+            # coincidence (e.g. the 100.0 in a winrate formula) as a real
+            # parameter, so do not guess.
+            return None
+        used.add(index)
+        segments.append(sql[position:match.start()])
+        slots.append((index, transform, literal))
+        position = match.end()
+    if len(used) != len(question_values):
+        return None
+    segments.append(sql[position:])
+    return segments, slots
+
+
+def bind_template(template, question_values) -> str:
+    segments, slots = template
+    parts = [segments[0]]
+    for (index, transform, literal), segment in zip(slots, segments[1:]):
+        value = question_values[index]
+        if transform == 'percent':
+            value = value / 100
+        parts.append(_format_number(value, literal))
+        parts.append(segment)
+    return ''.join(parts)
+
+
+class QueryTemplateCache:
+    def __init__(self, watcher: DatabaseWatcher, max_entries: int = None):
+        self.watcher = watcher
+        self.max_entries = max_entries or int(os.getenv('TEMPLATE_CACHE_SIZE', '256'))
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._schema_version = watcher.schema_version()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_schema(self):
+        schema_version = self.watcher.schema_version()
+        if schema_version != self._schema_version:
+            self._entries.clear()
+            self._schema_version = schema_version
+
+    def get(self, question: str):
+        key, values = normalize_question(question)
+        with self._lock:
+            self._check_schema()
+            template = self._entries.get(key)
+            if template is None:
+                self.misses += 1
+                record_cache("template", False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            record_cache("template", True)
+        return bind_template(template, values)
+
+    def put(self, question: str, sql: str) -> bool:
+        key, values = normalize_question(question)
+        template = build_template(values, sql)
+        if template is None:
+            return False
+        with self._lock:
+            self._check_schema()
+            self._entries[key] = template
+            self._entries.move_to_end(key)
+            self.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "stores": self.stores,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+            }
+
+
+def normalize_sql(sql: str) -> str:
+    # Case and whitespace are folded outside quoted literals only, so
+    # WHERE rank = 'I' and WHERE rank = 'i' stay distinct queries.
+    parts = []
+    position = 0
+    for match in SQL_TOKEN.finditer(sql):
+        if match.group()[0] not in '\'"':
+            continue
+        parts.append(re.sub(r'\s+', ' ', sql[position:match.start()]).lower())
+        parts.append(match.group())
+        position = match.end()
+    parts.append(re.sub(r'\s+', ' ', sql[position:]).lower())
+    return ''.join(parts).strip().rstrip(';').strip()
+
+
+class ResultCache:
+    def __init__(self, watcher: DatabaseWatcher, max_bytes: int = None):
+        self.watcher = watcher
+        self.max_bytes = max_bytes or int(os.getenv('RESULT_CACHE_BYTES', str(32 * 1024 * 1024)))
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.rejected = 0
+        self.bytes = 0
+        self._version = None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _check_version(self):
+        version = self.watcher.version()
+        if version != self._version:
+            self._entries.clear()
+            self.bytes = 0
+            self._version = version
+
+    def get(self, sql: str):
+        key = normalize_sql(sql)
+        with self._lock:
+            self._check_version()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                record_cache("result", False)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            record_cache("result", True)
+            return entry[0]
+
+    def put(self, sql: str, result, size: int = None) -> bool:
+        key = normalize_sql(sql)
+        size = sys.getsizeof(key) + (size if size is not None else sys.getsizeof(result))
+        if size > self.max_bytes:
+            self.rejected += 1
+            return False
+        with self._lock:
+            self._check_version()
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            while self._entries and self.bytes + size > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+            self._entries[key] = (result, size)
+            self.bytes += size
+        return True
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "rejected": self.rejected,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+            }
@@ -1,31 +1,29 @@
-from langchain_openai import ChatOpenAI
-from langchain_community.utilities import SQLDatabase
+from typing import TYPE_CHECKING
 from typing_extensions import TypedDict, Annotated
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_community.tools.sql_database.tool import QuerySQLDatabaseTool
 
-from langchain_core.tools import tool
-import sqlite3
-import re
+from sqlalchemy import inspect
+from caching import DatabaseWatcher, QueryTemplateCache, ResultCache, SchemaCache
+from connections import ConnectionManager
+from index_advisor import WorkloadRecorder
+from pipeline import CancelToken, QueryError, QueryPipeline
+from results import format_answer, materialize
+from schema_index import PRUNING_ENABLED, SchemaIndex
+from singleflight import SingleFlight
+from ollama_manager import get_ollama_manager
+from llm_output import ThinkTagFilter, parse_reasoning_output, remove_think_tags
+from metrics import add_rows, db_timer, instrument_node, instrument_tool, llm_call, metrics
+import asyncio
+import contextvars
 import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-try:
-    import psycopg2
-    PSYCOPG2_AVAILABLE = True
-except ImportError:
-    PSYCOPG2_AVAILABLE = False
-
-try:
-    import mysql.connector
-    MYSQL_AVAILABLE = True
-except ImportError:
-    MYSQL_AVAILABLE = False
-
-try:
-    import pyodbc
-    PYODBC_AVAILABLE = True
-except ImportError:
-    PYODBC_AVAILABLE = False
+# langchain_core, langgraph and the model client pull in tracing and HTTP
+# stacks; they are imported where first used so `import chat` stays cheap.
+if TYPE_CHECKING:
+    from langchain_core.runnables import RunnableConfig
 
 class State(TypedDict):
     question: str
@@ -33,187 +31,30 @@ class State(TypedDict):
     query: str
     validation_result: str
     result: str
+    results: list
     answer: str
     iteration: int
+    template_hit: bool
 
 class QueryOutput(TypedDict):
     query: Annotated[str, ..., "Syntactically valid SQL query."]
 
-class ReasoningOutput(TypedDict):
-    reasoning: Annotated[str, ..., "Step-by-step reasoning about the question and how to approach it."]
-    query: Annotated[str, ..., "Syntactically valid SQL query based on the reasoning."]
-
-db_uri = os.getenv('DATABASE_URI', 'sqlite:///league_players.db')
-db = SQLDatabase.from_uri(db_uri)
-
-llm = ChatOpenAI(
-    base_url="http://localhost:11434/v1",
-    api_key="ollama",
-    model="qwen3",
-)
-
-@tool(description="Get the complete database schema including all tables and their columns.")
-def get_database_schema() -> str:
-    return db.get_table_info()
-
-def validate_sql_syntax(query: str, dialect: str) -> str:
-    if not query.strip():
-        return "Query is empty."
-    
-    try:
-        query_upper = query.upper()
-        
-        if not any(keyword in query_upper for keyword in ['SELECT', 'FROM']):
-            return "Query must contain SELECT and FROM clauses."
-        
-        dangerous_patterns = [
-            r'DROP\s+TABLE',
-            r'DELETE\s+FROM',
-            r'UPDATE\s+.*\s+SET',
-            r'INSERT\s+INTO',
-            r'CREATE\s+TABLE',
-            r'ALTER\s+TABLE'
-        ]
-        
-        for pattern in dangerous_patterns:
-            if re.search(pattern, query_upper):
-                return f"Query contains potentially dangerous operation: {pattern}"
-        
-        if dialect == 'sqlite':
-            conn = sqlite3.connect('league_players.db')
-            cursor = conn.cursor()
-            try:
-                clean_query = query.strip()
-                if clean_query.endswith(';'):
-                    clean_query = clean_query[:-1]
-                cursor.execute(f"EXPLAIN {clean_query}")
-                cursor.fetchall()
-                conn.close()
-                return "Query syntax is valid."
-            except sqlite3.Error as e:
-                conn.close()
-                return f"SQL syntax error: {str(e)}"
-        
-        elif dialect == 'postgresql':
-            if not PSYCOPG2_AVAILABLE:
-                return "PostgreSQL driver (psycopg2) not available. Install with: pip install psycopg2-binary"
-            conn_str = os.getenv('POSTGRES_CONNECTION_STRING')
-            if not conn_str:
-                return "PostgreSQL connection string not configured. Set POSTGRES_CONNECTION_STRING environment variable."
-            conn = psycopg2.connect(conn_str)
-            cursor = conn.cursor()
-            try:
-                cursor.execute(f"EXPLAIN {query}")
-                cursor.fetchall()
-                conn.close()
-                return "Query syntax is valid."
-            except psycopg2.Error as e:
-                conn.close()
-                return f"SQL syntax error: {str(e)}"
-        
-        elif dialect == 'mysql':
-            if not MYSQL_AVAILABLE:
-                return "MySQL driver (mysql-connector-python) not available. Install with: pip install mysql-connector-python"
-            host = os.getenv('MYSQL_HOST', 'localhost')
-            user = os.getenv('MYSQL_USER', 'root')
-            password = os.getenv('MYSQL_PASSWORD', '')
-            database = os.getenv('MYSQL_DATABASE', 'test')
-            
-            conn = mysql.connector.connect(
-                host=host,
-                user=user,
-                password=password,
-                database=database
-            )
-            cursor = conn.cursor()
-            try:
-                cursor.execute(f"EXPLAIN {query}")
-                cursor.fetchall()
-                conn.close()
-                return "Query syntax is valid."
-            except mysql.connector.Error as e:
-                conn.close()
-                return f"SQL syntax error: {str(e)}"
-        
-        elif dialect == 'mssql':
-            if not PYODBC_AVAILABLE:
-                return "SQL Server driver (pyodbc) not available. Install with: pip install pyodbc and install ODBC drivers"
-            conn_str = os.getenv('MSSQL_CONNECTION_STRING')
-            if not conn_str:
-                return "SQL Server connection string not configured. Set MSSQL_CONNECTION_STRING environment variable."
-            conn = pyodbc.connect(conn_str)
-            cursor = conn.cursor()
-            try:
-                cursor.execute(f"SET SHOWPLAN_TEXT ON; {query}")
-                cursor.fetchall()
-                conn.close()
-                return "Query syntax is valid."
-            except pyodbc.Error as e:
-                conn.close()
-                return f"SQL syntax error: {str(e)}"
-        
-        else:
-            return f"Database dialect '{dialect}' not supported for syntax validation."
-            
-    except Exception as e:
-        return f"Validation error: {str(e)}"
-
-@tool(description="Validate if a SQL query is syntactically correct and uses valid tables/columns.")
-def validate_sql_query(query: str) -> str:
-    return validate_sql_syntax(query, db.dialect)
-
-@tool(description="Test execute a query with LIMIT 1 to check if it works without returning too much data.")
-def test_query_execution(query: str) -> str:
-    if not query.strip():
-        return "Query is empty."
-    
-    try:
-        test_query = query.strip()
-        
-        if test_query.endswith(';'):
-            test_query = test_query[:-1]
-        
-        if db.dialect == 'sqlite':
-            if 'LIMIT' not in test_query.upper():
-                test_query += " LIMIT 1"
-        elif db.dialect == 'postgresql':
-            if 'LIMIT' not in test_query.upper():
-                test_query += " LIMIT 1"
-        elif db.dialect == 'mysql':
-            if 'LIMIT' not in test_query.upper():
-                test_query += " LIMIT 1"
-        elif db.dialect == 'mssql':
-            if 'TOP' not in test_query.upper():
-                test_query = test_query.replace('SELECT', 'SELECT TOP 1', 1)
-        
-        execute_query_tool = QuerySQLDatabaseTool(db=db)
-        result = execute_query_tool.invoke(test_query)
-        return f"Query test successful. Sample result: {result}"
-    except Exception as e:
-        return f"Query execution failed: {str(e)}"
-
 react_system_message = """
 You are a ReAct (Reasoning + Acting) agent that helps users query a database. You follow this process:
 
 1. REASON: Think step-by-step about the user's question and how to approach it
 2. ACT: Generate a SQL query based on your reasoning
-3. OBSERVE: The system will validate and execute your query
-
-Available tools:
-- get_database_schema: Get the complete database schema
-- validate_sql_query: Check if a SQL query is syntactically correct
-- test_query_execution: Test execute a query with LIMIT 1
+3. OBSERVE: The system will check and execute your query
 
 Database dialect: {dialect}
 Table information: {table_info}
 
 CRITICAL SQL GUIDELINES:
 - Use standard SQL syntax for {dialect}
-- For winrate calculations: use (wins * 100.0 / (wins + losses)) or (wins * 100.0 / total_matches)
+{derived_column_guidelines}
 - DO NOT use non-existent functions like WIN_PERCENTAGE, WIN_PERC, etc.
 - For complex questions with multiple parts, generate multiple SQL queries separated by semicolons
 - Keep queries simple and efficient
-- Use proper decimal notation (0.52 for 52%, not 52.0)
 - Always use valid table and column names from the schema
 
 IMPORTANT: When providing reasoning, use exactly ONE set of think tags like this:
@@ -222,81 +63,14 @@ IMPORTANT: When providing reasoning, use exactly ONE set of think tags like this
 Do NOT use multiple closing tags or nested think tags. Use only one opening and one closing tag.
 """
 
-def reason_and_plan(state: State):
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", react_system_message),
-        ("user", "Question: {question}\n\nFirst, reason about this question step-by-step and plan how to approach it. If the question has multiple parts, break it down and plan separate queries for each part. For multi-part questions, you MUST generate multiple SQL queries separated by semicolons. Use <think> tags for your internal reasoning.")
-    ])
-    
-    reasoning_prompt = prompt.invoke({
-        "dialect": db.dialect,
-        "table_info": db.get_table_info(),
-        "question": state["question"]
-    })
-    
-    try:
-        structured_llm = llm.with_structured_output(ReasoningOutput)
-        result = structured_llm.invoke(reasoning_prompt)
-        
-        return {
-            "reasoning": result.get("reasoning", "No reasoning provided"),
-            "query": result.get("query", "")
-        }
-    except Exception as e:
-        fallback_response = llm.invoke(reasoning_prompt)
-        return {
-            "reasoning": f"Structured output failed: {str(e)}. Fallback response: {fallback_response.content}",
-            "query": ""
-        }
-
-def validate_and_refine(state: State):
-    validation_result = validate_sql_query.invoke(state["query"])
-    
-    if "valid" in validation_result.lower() or "successful" in validation_result.lower():
-        test_result = test_query_execution.invoke(state["query"])
-        if "failed" in test_result.lower():
-            return {
-                "query": state["query"],
-                "validation_result": f"Validation: {validation_result}\nTest: {test_result}\nNote: Query may need manual refinement."
-            }
-        else:
-            return {"validation_result": f"Validation: {validation_result}\nTest: {test_result}"}
-    else:
-        return {
-            "query": state["query"],
-            "validation_result": f"Validation failed: {validation_result}\nUsing original query."
-        }
+REASONING_MESSAGES = [
+    ("system", react_system_message),
+    ("user", "Question: {question}\n\nFirst, reason about this question step-by-step and plan how to approach it. If the question has multiple parts, break it down and plan separate queries for each part. For multi-part questions, you MUST generate multiple SQL queries separated by semicolons. Use <think> tags for your internal reasoning.\n\nAfter your reasoning, reply with only a JSON object of the form {{\"reasoning\": \"<your step-by-step reasoning>\", \"query\": \"<the SQL query or queries>\"}}.")
+]
 
-def execute_final_query(state: State):
-    if not state["query"].strip():
-        return {"result": "No query to execute - question cannot be answered with available schema."}
-    
-    try:
-        execute_query_tool = QuerySQLDatabaseTool(db=db)
-        
-        queries = [q.strip() for q in state["query"].split(';') if q.strip()]
-        
-        if len(queries) == 1:
-            result = execute_query_tool.invoke(queries[0])
-            return {"result": result}
-        else:
-            results = []
-            for i, query in enumerate(queries, 1):
-                try:
-                    result = execute_query_tool.invoke(query)
-                    results.append(f"Query {i}: {result}")
-                except Exception as e:
-                    results.append(f"Query {i} failed: {str(e)}")
-            
-            return {"result": "\n".join(results)}
-            
-    except Exception as e:
-        return {"result": f"Execution failed: {str(e)}"}
-
-def generate_final_answer(state: State):
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", "You are a helpful assistant that explains database query results in a clear, user-friendly way. Provide direct answers to the user's questions without showing internal reasoning or technical details in the final answer."),
-        ("user", """
+ANSWER_MESSAGES = [
+    ("system", "You are a helpful assistant that explains database query results in a clear, user-friendly way. Provide direct answers to the user's questions without showing internal reasoning or technical details in the final answer."),
+    ("user", """
 Given the following information, provide a clear and direct answer to the user's question:
 
 Question: {question}
@@ -305,7 +79,7 @@ Query Result: {result}
 
 Provide a simple, direct answer that:
 - Answers the user's question clearly
-- Uses the actual query results
+- Uses the actual query results, with decimals rounded to two places
 - Is written in plain English
 - Does NOT show SQL queries or technical details
 - Does NOT show internal reasoning or think tags
@@ -313,92 +87,573 @@ Provide a simple, direct answer that:
 
 If the query failed, simply explain why the question cannot be answered.
 """)
-    ])
-    
-    answer_prompt = prompt.invoke({
-        "question": state["question"],
-        "query": state["query"],
-        "result": state["result"]
-    })
-    
-    response = llm.invoke(answer_prompt)
-    return {"answer": response.content}
+]
+
+DERIVED_COLUMN_GUIDELINES = {
+    "winrate": "- For winrate questions use the precomputed, indexed winrate column (a percentage, e.g. winrate > 52); do not recompute it from wins and losses",
+    "total_games": "- For games played use the precomputed, indexed total_games column instead of wins + losses",
+    "rank_ordinal": "- To compare or sort by tier and division use the numeric rank_ordinal column (higher is better; CHALLENGER I is highest)",
+}
+INLINE_WINRATE_GUIDELINE = "- For winrate calculations: use (wins * 100.0 / (wins + losses)) or (wins * 100.0 / total_matches)"
+# Only for schemas without the winrate column, which stores percentages
+# (winrate > 52) and would contradict this.
+DECIMAL_NOTATION_GUIDELINE = "- Use proper decimal notation (0.52 for 52%, not 52.0)"
+
+SQL_COMMENT = re.compile(r'--[^\n]*|/\*.*?\*/', re.DOTALL)
+
+def route_after_template(state: State):
+    return "execute_final_query" if state.get("template_hit") else "reason_and_plan"
+
+def reasoning_update(content: str):
+    # One model call per question: malformed output is repaired locally
+    # rather than by asking the model again.
+    result, method = parse_reasoning_output(content)
+    metrics.increment("agent_reasoning_parse_total", method=method)
+    if method != "json":
+        metrics.increment("agent_reasoning_fallbacks_total")
+    return result
+
+def validate_and_refine(state: State):
+    # Syntax and read-only access are checked by the database when each
+    # statement is prepared in execute_final_query, so nothing runs here.
+    statements = split_statements(state["query"])
+    if not statements:
+        return {
+            "query": state["query"],
+            "validation_result": "Validation failed: Query is empty.\nUsing original query."
+        }
+
+    for statement in statements:
+        keyword = first_keyword(statement)
+        if not keyword:
+            return {
+                "query": state["query"],
+                "validation_result": "Validation failed: a statement has no SQL, only brackets.\nUsing original query."
+            }
+        if keyword not in ("SELECT", "WITH"):
+            return {
+                "query": state["query"],
+                "validation_result": f"Validation failed: only SELECT queries are allowed, got {keyword}.\nUsing original query."
+            }
+
+    return {"validation_result": f"Validation: {len(statements)} statement(s) passed static checks; each is prepared once at execution with read-only access enforced by the database."}
+
+def first_keyword(statement: str) -> str:
+    words = SQL_COMMENT.sub(" ", statement).lstrip("( \t\r\n").split(None, 1)
+    return words[0].upper() if words else ""
+
+def split_statements(query: str):
+    # A trailing comment after the last semicolon is not a statement of its own.
+    return [q.strip() for q in query.split(';') if SQL_COMMENT.sub("", q).strip()]
+
+def combine_statement_results(outcomes):
+    # The prompt gets the budgeted text; the full rows travel separately in
+    # "results" for callers that display them.
+    results = [result if error is None else {"error": str(error), "kind": error.kind} for result, error in outcomes]
 
-from langgraph.graph import START, StateGraph
+    if len(outcomes) == 1:
+        result, error = outcomes[0]
+        if error is not None:
+            return {"result": f"Execution failed: {str(error)}", "results": results}
+        return {"result": result["prompt_text"], "results": results}
 
-workflow = StateGraph(State)
+    lines = []
+    for i, (result, error) in enumerate(outcomes, 1):
+        if error is not None:
+            lines.append(f"Query {i} failed: {str(error)}")
+        else:
+            lines.append(f"Query {i}: {result['prompt_text']}")
+    return {"result": "\n".join(lines), "results": results}
+
+def cancel_token_from(config: "RunnableConfig"):
+    return (config or {}).get("configurable", {}).get("cancel_token")
+
+def fast_answer(state: State):
+    # Scalars and short lists are formatted directly; only results that need
+    # explaining cost a second model call.
+    from langgraph.config import get_stream_writer
+
+    answer = format_answer(state["question"], state.get("results"))
+    metrics.increment("agent_answer_total", path="llm" if answer is None else "fast_path")
+    if answer is not None:
+        get_stream_writer()({"token": answer})
+    return answer
+
+def build_workflow(match, reason, validate, execute, answer):
+    from langgraph.graph import START, StateGraph
+
+    workflow = StateGraph(State)
+
+    workflow.add_node("match_template", instrument_node("match_template")(match))
+    workflow.add_node("reason_and_plan", instrument_node("reason_and_plan")(reason))
+    workflow.add_node("validate_and_refine", instrument_node("validate_and_refine")(validate))
+    workflow.add_node("execute_final_query", instrument_node("execute_final_query")(execute))
+    workflow.add_node("generate_final_answer", instrument_node("generate_final_answer")(answer))
+
+    workflow.add_edge(START, "match_template")
+    workflow.add_conditional_edges("match_template", route_after_template, ["reason_and_plan", "execute_final_query"])
+    workflow.add_edge("reason_and_plan", "validate_and_refine")
+    workflow.add_edge("validate_and_refine", "execute_final_query")
+    workflow.add_edge("execute_final_query", "generate_final_answer")
+    return workflow
+
+def initial_state(question: str):
+    return {"question": question, "iteration": 0, "template_hit": False}
+
+class AgentEvent(TypedDict):
+    type: str        # "step" once a node finishes, "token" for each streamed answer chunk,
+                     # "cancelled" as the last event of a cancelled run
+    node: str
+    payload: dict    # the node's state update, or {"token": text}
+    elapsed: float   # seconds since the previous step event
+    total: float     # seconds since the run started
+
+STEP_TITLES = {
+    "reason_and_plan": "REASONING STEP:",
+    "validate_and_refine": "VALIDATION STEP:",
+    "execute_final_query": "EXECUTION STEP:",
+    "generate_final_answer": "FINAL ANSWER:",
+}
+
+class _EventClock:
+    def __init__(self):
+        self.started = self.last_step = time.perf_counter()
+
+    def token(self, text: str) -> AgentEvent:
+        now = time.perf_counter()
+        return {"type": "token", "node": "generate_final_answer", "payload": {"token": text},
+                "elapsed": now - self.last_step, "total": now - self.started}
+
+    def cancelled(self, node: str) -> AgentEvent:
+        now = time.perf_counter()
+        return {"type": "cancelled", "node": node, "payload": {}, "elapsed": now - self.last_step,
+                "total": now - self.started}
+
+    def steps(self, update: dict):
+        now = time.perf_counter()
+        elapsed, self.last_step = now - self.last_step, now
+        for node_name, node_output in update.items():
+            yield {"type": "step", "node": node_name, "payload": node_output or {},
+                   "elapsed": elapsed, "total": now - self.started}
+
+def run_config(cancel_token: CancelToken = None):
+    return {"configurable": {"cancel_token": cancel_token}}
+
+def describe_step(event: AgentEvent):
+    """Title and markdown lines for a step event, or None for steps that show nothing."""
+    node_output = event["payload"]
+    node_name = event["node"]
+    if node_name == "match_template":
+        # A template hit stands in for the reasoning step.
+        if not node_output.get("template_hit"):
+            return None
+        node_name = "reason_and_plan"
+    if node_name == "reason_and_plan":
+        lines = [f"Reasoning: {node_output.get('reasoning', 'N/A')}",
+                 f"Initial Query: {node_output.get('query', 'N/A')}"]
+    elif node_name == "validate_and_refine":
+        lines = [f"Validation Result: {node_output.get('validation_result', 'N/A')}"]
+        if 'query' in node_output:
+            lines.append(f"Refined Query: {node_output['query']}")
+    elif node_name == "execute_final_query":
+        lines = [f"Result: {node_output.get('result', 'N/A')}"]
+    elif node_name == "generate_final_answer":
+        lines = [f"Answer: {node_output.get('answer', 'N/A')}"]
+    else:
+        return None
+    return STEP_TITLES[node_name], lines
+
+class AgentRuntime:
+    """Everything one agent configuration needs, built once and shared by its sessions.
+
+    The caches, pools and compiled graphs are safe to use from many threads
+    (or one event loop) at once; separate runtimes share nothing but the
+    process-wide Ollama manager and metrics registry.
+    """
+
+    def __init__(self, db_uri: str = None, llm=None, sessions: int = None, ollama=None):
+        self.db_uri = db_uri or os.getenv('DATABASE_URI', 'sqlite:///league_players.db')
+        # A DB connection per concurrent session; statements of one question
+        # fan out over the same pool.
+        self.connections = ConnectionManager(self.db_uri, pool_size=sessions)
+        self.sessions = sessions or self.connections.pool_size
+        self.watcher = DatabaseWatcher(self.db_uri)
+        # The schema is reflected when the first prompt needs it, not here.
+        self.schema_cache = SchemaCache(self.reflect_schema, self.watcher)
+        self.template_cache = QueryTemplateCache(self.watcher)
+        self.result_cache = ResultCache(self.watcher)
+        self.query_pipeline = QueryPipeline(self.connections)
+        self.schema_index = SchemaIndex(self.connections, self.watcher)
+        self.workload_recorder = WorkloadRecorder(self.connections)
+        self.statement_executor = ThreadPoolExecutor(max_workers=self.connections.pool_size,
+                                                     thread_name_prefix="sql-statement")
+
+        self.ollama = ollama or get_ollama_manager()
+        self.http_client = self.http_async_client = None
+        self.llm = llm or self.build_llm()
+
+        from langchain_core.prompts import ChatPromptTemplate
+
+        self.reasoning_prompt = ChatPromptTemplate.from_messages(REASONING_MESSAGES)
+        self.answer_prompt = ChatPromptTemplate.from_messages(ANSWER_MESSAGES)
+        self.graph = build_workflow(
+            self.match_template, self.reason_and_plan, validate_and_refine,
+            self.execute_final_query, self.generate_final_answer
+        ).compile()
+        self.async_graph = build_workflow(
+            self.amatch_template, self.areason_and_plan, validate_and_refine,
+            self.aexecute_final_query, self.agenerate_final_answer
+        ).compile()
+        # Identical questions asked while one is still running share its run.
+        self.flights = SingleFlight(self.run_graph, self.arun_graph)
+
+    def build_llm(self):
+        # langchain_openai (and the openai SDK under it) is the slowest import
+        # of the agent, so it is only loaded when a runtime needs a real model.
+        import httpx
+        from langchain_openai import ChatOpenAI
+
+        # Keep-alive connections to the model server, one per session, so
+        # requests skip the TCP handshake.
+        limits = httpx.Limits(max_connections=self.sessions, max_keepalive_connections=self.sessions)
+        self.http_client = httpx.Client(limits=limits, timeout=None)
+        self.http_async_client = httpx.AsyncClient(limits=limits, timeout=None)
+        return ChatOpenAI(
+            base_url=self.ollama.openai_base_url,
+            api_key="ollama",
+            model=self.ollama.model,
+            stream_usage=True,
+            # Every request resets how long Ollama keeps the model loaded, so
+            # the warm-up's keep_alive has to be repeated on each chat call.
+            extra_body={"keep_alive": self.ollama.keep_alive},
+            http_client=self.http_client,
+            http_async_client=self.http_async_client,
+        )
+
+    def reflect_schema(self):
+        from langchain_community.utilities import SQLDatabase
+
+        return SQLDatabase(self.connections.engine)
+
+    @property
+    def db(self):
+        return self.schema_cache.db
+
+    def close(self):
+        # From inside an event loop, await aclose() instead.
+        if self.http_async_client is not None:
+            asyncio.run(self.http_async_client.aclose())
+        self._release()
+
+    async def aclose(self):
+        if self.http_async_client is not None:
+            await self.http_async_client.aclose()
+        self._release()
+
+    def _release(self):
+        self.statement_executor.shutdown(wait=False)
+        if self.http_client is not None:
+            self.http_client.close()
+        self.watcher.close()
+        self.connections.dispose()
+
+    @instrument_tool("execute_query")
+    def run_query(self, query: str, cancel_token: CancelToken = None) -> dict:
+        cached = self.result_cache.get(query)
+        if cached is not None:
+            add_rows(cached["row_count"])
+            return cached
+        started = time.perf_counter()
+        with db_timer():
+            result = materialize(self.query_pipeline.iter_batches(query, cancel_token=cancel_token))
+        if self.workload_recorder.enabled:
+            self.workload_recorder.record(query, time.perf_counter() - started, result["row_count"])
+        add_rows(result["row_count"])
+        self.result_cache.put(query, result, size=result["approx_bytes"])
+        return result
+
+    # Graph nodes
+
+    def match_template(self, state: State):
+        query = self.template_cache.get(state["question"])
+        if query is None:
+            return {"template_hit": False}
+        return {
+            "template_hit": True,
+            "reasoning": "Matched a cached question template; reused its validated query with the new values.",
+            "query": query,
+            "validation_result": "Skipped: the template was validated when it was cached."
+        }
 
-workflow.add_node("reason_and_plan", reason_and_plan)
-workflow.add_node("validate_and_refine", validate_and_refine)
-workflow.add_node("execute_final_query", execute_final_query)
-workflow.add_node("generate_final_answer", generate_final_answer)
+    def select_table_info(self, question: str) -> str:
+        # Falls back to the full schema whenever the keyword index is not
+        # confident it found the tables the question is about; select() then
+        # returns no selection (its confidence is below SCHEMA_MIN_CONFIDENCE).
+        selection = None
+        if PRUNING_ENABLED:
+            selection, _ = self.schema_index.select(question)
+        if selection is None:
+            return self.schema_cache.get_table_info()
+        key = ("pruned",) + tuple((table, tuple(columns)) for table, columns in sorted(selection.items()))
+        return self.schema_cache.get(key, lambda db: self.schema_index.describe(selection))
+
+    def derived_column_guidelines(self, db) -> str:
+        # Databases built before the derived columns existed keep the inline
+        # formula; the guidelines follow the schema, not the builder version.
+        inspector = inspect(self.connections.engine)
+        columns = {column["name"] for table in db.get_usable_table_names() for column in inspector.get_columns(table)}
+        lines = [line for column, line in DERIVED_COLUMN_GUIDELINES.items() if column in columns]
+        if "winrate" not in columns:
+            lines[:0] = [INLINE_WINRATE_GUIDELINE, DECIMAL_NOTATION_GUIDELINE]
+        return "\n".join(lines)
+
+    def build_reasoning_prompt(self, state: State):
+        return self.reasoning_prompt.invoke({
+            "dialect": self.connections.dialect,
+            "derived_column_guidelines": self.schema_cache.get(("derived_column_guidelines",),
+                                                               self.derived_column_guidelines),
+            "table_info": self.select_table_info(state["question"]),
+            "question": state["question"]
+        })
+
+    def reason_and_plan(self, state: State):
+        reasoning_prompt = self.build_reasoning_prompt(state)
+        # Streamed, so the wait for the first token (prompt eval) is timed
+        # apart from generation.
+        content = ""
+        with llm_call("reason_and_plan") as call:
+            for chunk in self.llm.stream(reasoning_prompt):
+                call.observe(chunk)
+                content += chunk.content
+        return reasoning_update(content)
+
+    async def areason_and_plan(self, state: State):
+        reasoning_prompt = await asyncio.to_thread(self.build_reasoning_prompt, state)
+        content = ""
+        with llm_call("reason_and_plan") as call:
+            async for chunk in self.llm.astream(reasoning_prompt):
+                call.observe(chunk)
+                content += chunk.content
+        return reasoning_update(content)
+
+    def run_statement(self, query: str, cancel_token: CancelToken = None):
+        try:
+            return self.run_query(query, cancel_token), None
+        except QueryError as e:
+            return None, e
+        except Exception as e:
+            return None, QueryError('execution', str(e))
 
-workflow.add_edge(START, "reason_and_plan")
-workflow.add_edge("reason_and_plan", "validate_and_refine")
-workflow.add_edge("validate_and_refine", "execute_final_query")
-workflow.add_edge("execute_final_query", "generate_final_answer")
+    def remember_template(self, state: State, outcomes):
+        if not state.get("template_hit") and all(error is None for _, error in outcomes):
+            self.template_cache.put(state["question"], state["query"])
 
-graph = workflow.compile()
+    def execute_final_query(self, state: State, config: "RunnableConfig"):
+        cancel_token = cancel_token_from(config)
+        if not state["query"].strip():
+            return {"result": "No query to execute - question cannot be answered with available schema.", "results": []}
+
+        queries = split_statements(state["query"])
+        if len(queries) == 1:
+            outcomes = [self.run_statement(queries[0], cancel_token)]
+        else:
+            # Each statement checks out its own pooled connection, so independent
+            # statements overlap and the node costs as much as the slowest one.
+            # Copy the context per statement so timings land in this node's span.
+            contexts = [contextvars.copy_context() for _ in queries]
+            outcomes = list(self.statement_executor.map(
+                lambda ctx, q: ctx.run(self.run_statement, q, cancel_token), contexts, queries
+            ))
+
+        self.remember_template(state, outcomes)
+        return combine_statement_results(outcomes)
+
+    def build_answer_prompt(self, state: State):
+        return self.answer_prompt.invoke({
+            "question": state["question"],
+            "query": state["query"],
+            "result": state["result"]
+        })
+
+    def generate_final_answer(self, state: State):
+        answer = fast_answer(state)
+        if answer is not None:
+            return {"answer": answer}
+        from langgraph.config import get_stream_writer
+
+        answer_prompt = self.build_answer_prompt(state)
+        writer = get_stream_writer()
+        think_filter = ThinkTagFilter()
+        content = ""
+        with llm_call("generate_final_answer") as call:
+            for chunk in self.llm.stream(answer_prompt):
+                call.observe(chunk)
+                content += chunk.content
+                visible = think_filter.feed(chunk.content)
+                if visible:
+                    writer({"token": visible})
+        tail = think_filter.flush()
+        if tail:
+            writer({"token": tail})
+        return {"answer": remove_think_tags(content)}
+
+    async def agenerate_final_answer(self, state: State):
+        answer = fast_answer(state)
+        if answer is not None:
+            return {"answer": answer}
+        from langgraph.config import get_stream_writer
+
+        answer_prompt = await asyncio.to_thread(self.build_answer_prompt, state)
+        writer = get_stream_writer()
+        think_filter = ThinkTagFilter()
+        content = ""
+        with llm_call("generate_final_answer") as call:
+            async for chunk in self.llm.astream(answer_prompt):
+                call.observe(chunk)
+                content += chunk.content
+                visible = think_filter.feed(chunk.content)
+                if visible:
+                    writer({"token": visible})
+        tail = think_filter.flush()
+        if tail:
+            writer({"token": tail})
+        return {"answer": remove_think_tags(content)}
+
+    # The DB layer is synchronous SQLAlchemy on a shared pool, so the async nodes
+    # hand DB-bound work to worker threads and keep the event loop free.
+    async def amatch_template(self, state: State):
+        return await asyncio.to_thread(self.match_template, state)
+
+    async def aexecute_final_query(self, state: State, config: "RunnableConfig"):
+        cancel_token = cancel_token_from(config)
+        if not state["query"].strip():
+            return {"result": "No query to execute - question cannot be answered with available schema.", "results": []}
+
+        queries = split_statements(state["query"])
+        outcomes = await asyncio.gather(*(asyncio.to_thread(self.run_statement, q, cancel_token) for q in queries))
+        self.remember_template(state, outcomes)
+        return combine_statement_results(outcomes)
+
+    # Running questions
+
+    def stream(self, question: str, cancel_token: CancelToken = None):
+        return self.flights.stream(question, cancel_token)
+
+    async def astream(self, question: str, cancel_token: CancelToken = None):
+        async for event in self.flights.astream(question, cancel_token):
+            yield event
+
+    def run_graph(self, question: str, cancel_token: CancelToken = None):
+        # A cancelled run interrupts its running statement and stops between
+        # steps. The step that noticed (e.g. execute_final_query carrying a
+        # "cancelled" error) is still delivered, then a "cancelled" event.
+        clock = _EventClock()
+        node = None
+        for mode, step in self.graph.stream(initial_state(question), run_config(cancel_token),
+                                            stream_mode=["updates", "custom"]):
+            if mode == "custom":
+                if "token" in step and not (cancel_token is not None and cancel_token.cancelled):
+                    yield clock.token(step["token"])
+                continue
+            for event in clock.steps(step):
+                node = event["node"]
+                yield event
+            if cancel_token is not None and cancel_token.cancelled and node != "generate_final_answer":
+                yield clock.cancelled(node)
+                return
+
+    async def arun_graph(self, question: str, cancel_token: CancelToken = None):
+        clock = _EventClock()
+        node = None
+        async for mode, step in self.async_graph.astream(initial_state(question), run_config(cancel_token),
+                                                         stream_mode=["updates", "custom"]):
+            if mode == "custom":
+                if "token" in step and not (cancel_token is not None and cancel_token.cancelled):
+                    yield clock.token(step["token"])
+                continue
+            for event in clock.steps(step):
+                node = event["node"]
+                yield event
+            if cancel_token is not None and cancel_token.cancelled and node != "generate_final_answer":
+                yield clock.cancelled(node)
+                return
+
+    async def arun(self, question: str, cancel_token: CancelToken = None):
+        state = initial_state(question)
+        async for event in self.astream(question, cancel_token):
+            if event["type"] == "step":
+                state.update(event["payload"])
+        return state
+
+    def run(self, question: str):
+        print("=" * 50)
+        state = initial_state(question)
+        for event in self.stream(question):
+            if event["type"] == "cancelled":
+                print("Cancelled.")
+                break
+            if event["type"] != "step":
+                continue
+            state.update(event["payload"])
+            described = describe_step(event)
+            if described is None:
+                continue
+            title, lines = described
+            print(f"{title} ({event['elapsed']:.2f}s)")
+            for line in lines:
+                print(line)
+            print("=" * 50 if event["node"] == "generate_final_answer" else "-" * 30)
+        return state
+
+_default_runtime = None
+_default_runtime_lock = threading.Lock()
+
+def get_default_runtime() -> AgentRuntime:
+    global _default_runtime
+    with _default_runtime_lock:
+        if _default_runtime is None:
+            _default_runtime = AgentRuntime()
+        return _default_runtime
+
+def set_default_runtime(runtime: AgentRuntime):
+    global _default_runtime
+    with _default_runtime_lock:
+        _default_runtime = runtime
+
+def stream_react_agent(question: str, cancel_token: CancelToken = None):
+    return get_default_runtime().stream(question, cancel_token)
+
+async def astream_react_agent(question: str, cancel_token: CancelToken = None):
+    async for event in get_default_runtime().astream(question, cancel_token):
+        yield event
+
+async def arun_react_agent(question: str, cancel_token: CancelToken = None):
+    return await get_default_runtime().arun(question, cancel_token)
 
 def run_react_agent(question: str):
-    print("=" * 50)
-    
-    for step in graph.stream(
-        {"question": question, "iteration": 0},
-        stream_mode="updates"
-    ):
-        node_name = list(step.keys())[0]
-        node_output = step[node_name]
-        
-        if node_name == "reason_and_plan":
-            print("REASONING STEP:")
-            print(f"Reasoning: {node_output.get('reasoning', 'N/A')}")
-            print(f"Initial Query: {node_output.get('query', 'N/A')}")
-            print("-" * 30)
-            
-        elif node_name == "validate_and_refine":
-            print("VALIDATION STEP:")
-            print(f"Validation Result: {node_output.get('validation_result', 'N/A')}")
-            if 'query' in node_output:
-                print(f"Refined Query: {node_output['query']}")
-            print("-" * 30)
-            
-        elif node_name == "execute_final_query":
-            print("EXECUTION STEP:")
-            print(f"Result: {node_output.get('result', 'N/A')}")
-            print("-" * 30)
-            
-        elif node_name == "generate_final_answer":
-            print("FINAL ANSWER:")
-            print(f"Answer: {node_output.get('answer', 'N/A')}")
-            print("=" * 50)
-
-def extract_think_tags(text):
-    think_pattern = r'<think>(.*?)</think>'
-    thoughts = re.findall(think_pattern, text, re.DOTALL)
-    return thoughts
-
-def remove_think_tags(text):
-    if not text:
-        return ""
-    cleaned = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
-    cleaned = re.sub(r'</think>+', '', cleaned)
-    cleaned = re.sub(r'<think>+', '', cleaned)
-    return cleaned.strip()
+    return get_default_runtime().run(question)
 
 if __name__ == "__main__":
+    runtime = get_default_runtime()
+    ollama = runtime.ollama
+    print(f"Waiting for Ollama to serve {ollama.model}...")
+    if not ollama.ensure_ready():
+        print(f"Ollama is not ready: {ollama.error}")
+    elif ollama.load_time is not None:
+        print(f"Model loaded in {ollama.load_time:.1f}s")
+
     print("Interactive Mode - Ask your questions!")
     print("Type 'quit' to exit")
-    
+
     while True:
         try:
             user_question = input("\nEnter your question: ").strip()
             if user_question.lower() in ['quit', 'exit', 'q']:
                 break
             if user_question:
-                run_react_agent(user_question)
+                runtime.run(user_question)
         except KeyboardInterrupt:
             print("\nGoodbye!")
             break
         except Exception as e:
-            print(f"Error: {e}")
\ No newline at end of file
+            print(f"Error: {e}")
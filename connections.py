@@ -0,0 +1,85 @@
+import os
+import threading
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+
+# The optional extras in pyproject.toml install these drivers, so prefer them
+# over SQLAlchemy's per-dialect defaults when the URI does not name one.
+DEFAULT_DRIVERS = {
+    'postgresql': 'psycopg2',
+    'mysql': 'mysqlconnector',
+    'mssql': 'pyodbc',
+}
+
+# Valid on every supported dialect.
+WARMUP_STATEMENT = "SELECT 1"
+
+
+def resolve_url(db_uri: str):
+    url = make_url(db_uri)
+    backend = url.get_backend_name()
+    if '+' not in url.drivername and backend in DEFAULT_DRIVERS:
+        url = url.set(drivername=f"{backend}+{DEFAULT_DRIVERS[backend]}")
+    return url
+
+
+class ConnectionManager:
+    def __init__(self, db_uri: str, pool_size: int = None, max_overflow: int = None,
+                 pool_recycle: int = None, warm: bool = None):
+        self.url = resolve_url(db_uri)
+        self.dialect = self.url.get_backend_name()
+        self.pool_size = pool_size or int(os.getenv('DB_POOL_SIZE', '5'))
+        self.max_overflow = max_overflow if max_overflow is not None else int(os.getenv('DB_MAX_OVERFLOW', '5'))
+        self.pool_recycle = pool_recycle or int(os.getenv('DB_POOL_RECYCLE', '1800'))
+        self.engine = create_engine(
+            self.url,
+            pool_size=self.pool_size,
+            max_overflow=self.max_overflow,
+            pool_recycle=self.pool_recycle,
+            pool_pre_ping=True,
+        )
+        self.warmed = False
+        self._lock = threading.Lock()
+        if warm if warm is not None else os.getenv('DB_POOL_WARM', '1') == '1':
+            self.warm()
+
+    def connect(self):
+        return self.engine.connect()
+
+    def warm(self):
+        with self._lock:
+            if self.warmed:
+                return
+            # Check out pool_size connections at once so each one is opened
+            # (and handshaken) now rather than on the first questions.
+            connections = []
+            try:
+                for _ in range(self.pool_size):
+                    conn = self.engine.connect()
+                    connections.append(conn)
+                    conn.exec_driver_sql(WARMUP_STATEMENT).fetchall()
+            finally:
+                for conn in connections:
+                    conn.close()
+            self.warmed = True
+
+    def healthy(self) -> bool:
+        try:
+            with self.engine.connect() as conn:
+                conn.exec_driver_sql(WARMUP_STATEMENT).fetchall()
+            return True
+        except Exception:
+            return False
+
+    def stats(self) -> dict:
+        pool = self.engine.pool
+        stats = {"dialect": self.dialect, "pool_size": self.pool_size, "warmed": self.warmed}
+        for name in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, name):
+                stats[name] = getattr(pool, name)()
+        return stats
+
+    def dispose(self):
+        self.engine.dispose()
+        self.warmed = False
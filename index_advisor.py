@@ -0,0 +1,412 @@
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import Counter
+
+from sqlalchemy import inspect
+
+from caching import normalize_sql
+from connections import ConnectionManager
+
+WORKLOAD_LOG = os.getenv('QUERY_WORKLOAD_LOG')
+TIMING_REPEATS = 3
+
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+IDENTIFIER = r'["`\[]?(\w+)["`\]]?'
+TABLE_REFERENCE = re.compile(rf'\b(?:FROM|JOIN)\s+{IDENTIFIER}(?:\s+(?:AS\s+)?{IDENTIFIER})?', re.IGNORECASE)
+PREDICATE = re.compile(
+    rf'(?:(\w+)\.)?{IDENTIFIER}\s*(==|=|<=|>=|<>|!=|<|>|\bIN\b|\bIS\b|\bBETWEEN\b|\bLIKE\b)',
+    re.IGNORECASE,
+)
+ORDER_ITEM = re.compile(rf'^(?:(\w+)\.)?{IDENTIFIER}(?:\s+(ASC|DESC))?(?:\s+NULLS\s+(?:FIRST|LAST))?$', re.IGNORECASE)
+MIN_MAX = re.compile(rf'\b(?:MIN|MAX)\s*\(\s*(?:(\w+)\.)?{IDENTIFIER}\s*\)', re.IGNORECASE)
+CLAUSE = re.compile(r'\b(WHERE|GROUP\s+BY|HAVING|ORDER\s+BY|LIMIT|UNION|WINDOW)\b', re.IGNORECASE)
+NOT_ALIASES = {
+    'where', 'join', 'inner', 'left', 'right', 'full', 'cross', 'outer', 'natural', 'on', 'using',
+    'group', 'order', 'limit', 'having', 'union', 'window', 'as',
+}
+EQUALITY = {'=', '==', 'in', 'is'}
+RANGE = {'<', '>', '<=', '>=', 'between', 'like'}
+
+# A bare SEARCH (MIN/MAX without an index) reads the table just like a SCAN.
+PLAN_SCAN = re.compile(r'^(?:SCAN|SEARCH) (?:TABLE )?(\w+)(?: AS (\w+))?$')
+PLAN_AUTOMATIC_INDEX = re.compile(r'^SEARCH (?:TABLE )?(\w+)(?: AS (\w+))? USING AUTOMATIC .*INDEX \((.+)\)')
+PLAN_TEMP_SORT = re.compile(r'USE TEMP B-TREE FOR (?:(?:RIGHT PART|LAST TERM) OF )?(ORDER BY|GROUP BY|DISTINCT)')
+
+
+def _clauses(sql: str) -> dict:
+    # Top-level clause text of the outermost SELECT; nested parentheses are
+    # skipped so a subquery's WHERE is not mistaken for the outer one.
+    depth = 0
+    outer = []
+    for char in sql:
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        outer.append(char if depth == 0 or char in '()' else ' ')
+    flat = ''.join(outer)
+    clauses = {}
+    matches = list(CLAUSE.finditer(flat))
+    for i, match in enumerate(matches):
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(sql)
+        name = re.sub(r'\s+', ' ', match.group(1).upper())
+        clauses.setdefault(name, sql[match.end():end])
+    return clauses
+
+
+def _split_list(text: str):
+    items, depth, current = [], 0, []
+    for char in text:
+        if char == ',' and depth == 0:
+            items.append(''.join(current).strip())
+            current = []
+            continue
+        depth += char == '('
+        depth -= char == ')'
+        current.append(char)
+    items.append(''.join(current).strip())
+    return [item for item in items if item]
+
+
+class QueryShape:
+    """Which columns of which tables a statement filters, sorts and groups on."""
+
+    def __init__(self, sql: str, table_columns: dict):
+        self.sql = STRING_LITERAL.sub('?', sql)
+        self.table_columns = table_columns
+        self.aliases = {}
+        for table, alias in TABLE_REFERENCE.findall(self.sql):
+            resolved = self._table(table)
+            if resolved is None:
+                continue
+            self.aliases[resolved.lower()] = resolved
+            if alias and alias.lower() not in NOT_ALIASES:
+                self.aliases[alias.lower()] = resolved
+        clauses = _clauses(self.sql)
+        self.equality = []
+        self.ranges = []
+        for qualifier, column, operator in self._predicates(clauses.get('WHERE', '')):
+            resolved = self._column(qualifier, column)
+            if resolved is None:
+                continue
+            if operator.lower() in EQUALITY and resolved not in self.equality:
+                self.equality.append(resolved)
+            elif operator.lower() in RANGE and resolved not in self.ranges:
+                self.ranges.append(resolved)
+        self.order = self._column_list(clauses.get('ORDER BY', ''))
+        self.group = self._column_list(clauses.get('GROUP BY', ''))
+        self.min_max = []
+        for qualifier, column in MIN_MAX.findall(self.sql):
+            resolved = self._column(qualifier, column)
+            if resolved is not None and resolved not in self.min_max:
+                self.min_max.append(resolved)
+
+    def _table(self, name: str):
+        for table in self.table_columns:
+            if table.lower() == name.lower():
+                return table
+        return None
+
+    def _column(self, qualifier: str, column: str):
+        if qualifier:
+            tables = [self.aliases[qualifier.lower()]] if qualifier.lower() in self.aliases else []
+        else:
+            tables = sorted(set(self.aliases.values()))
+        matches = [
+            (table, name) for table in tables for name in self.table_columns[table]
+            if name.lower() == column.lower()
+        ]
+        return matches[0] if len(matches) == 1 else None
+
+    def _predicates(self, where: str):
+        for match in PREDICATE.finditer(where):
+            # `wins * 100.0 / (wins + losses) > 52` compares an expression,
+            # which a plain column index cannot serve.
+            before = where[:match.start()].rstrip()
+            if before and before[-1] in '*/+-%|':
+                continue
+            yield match.groups()
+
+    def _column_list(self, text: str):
+        columns = []
+        for item in _split_list(text):
+            match = ORDER_ITEM.match(item)
+            resolved = self._column(match.group(1), match.group(2)) if match else None
+            if resolved is None:
+                # One expression or output alias in the list and no index on
+                # table columns can produce the order.
+                return []
+            columns.append(resolved)
+        return columns
+
+    def for_table(self, attribute: str, table: str):
+        return [column for t, column in getattr(self, attribute) if t == table]
+
+
+def explain_plan(connections: ConnectionManager, sql: str):
+    if connections.dialect != 'sqlite':
+        return None
+    with connections.connect() as conn:
+        rows = conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}", execution_options={"no_parameters": True})
+        return [row[-1] for row in rows]
+
+
+class WorkloadRecorder:
+    """Appends each executed agent statement and its query plan to a JSONL log."""
+
+    def __init__(self, connections: ConnectionManager, path: str = WORKLOAD_LOG):
+        self.connections = connections
+        self.path = path
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    def record(self, sql: str, elapsed: float, rows: int):
+        if not self.path:
+            return
+        try:
+            plan = explain_plan(self.connections, sql)
+        except Exception:
+            plan = None
+        entry = {"timestamp": time.time(), "sql": sql, "elapsed": elapsed, "rows": rows, "plan": plan}
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(entry) + "\n")
+
+
+def load_workload(path: str):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def index_name(table: str, columns) -> str:
+    return "ix_" + "_".join([table] + list(columns)).lower()
+
+
+class IndexAdvisor:
+    def __init__(self, connections: ConnectionManager):
+        self.connections = connections
+        inspector = inspect(connections.engine)
+        self.table_columns = {}
+        self.existing = set()
+        for table in inspector.get_table_names():
+            self.table_columns[table] = [column['name'] for column in inspector.get_columns(table)]
+            for index in inspector.get_indexes(table):
+                names = tuple(column for column in index['column_names'] if column)
+                # Any prefix of an existing index is already served by it.
+                for length in range(1, len(names) + 1):
+                    self.existing.add((table, names[:length]))
+
+    def analyze(self, workload):
+        """Group the workload by statement and aggregate plan problems into candidate indexes."""
+        statements = {}
+        for entry in workload:
+            key = normalize_sql(entry["sql"])
+            statement = statements.setdefault(key, {
+                "sql": entry["sql"], "count": 0, "elapsed": 0.0,
+                "plan": entry.get("plan") or explain_plan(self.connections, entry["sql"]) or [],
+            })
+            statement["count"] += 1
+            statement["elapsed"] += entry.get("elapsed") or 0.0
+
+        problems = Counter()
+        candidates = {}
+        for key, statement in statements.items():
+            shape = QueryShape(statement["sql"], self.table_columns)
+            for table, columns, reason in self._candidates(shape, statement["plan"], problems):
+                columns = tuple(columns)
+                if not columns or (table, columns) in self.existing:
+                    continue
+                candidate = candidates.setdefault((table, columns), {
+                    "table": table, "columns": list(columns), "name": index_name(table, columns),
+                    "reasons": Counter(), "statements": [], "runs": 0, "observed_time": 0.0,
+                })
+                candidate["reasons"][reason] += 1
+                if key not in candidate["statements"]:
+                    candidate["statements"].append(key)
+                    candidate["runs"] += statement["count"]
+                    candidate["observed_time"] += statement["elapsed"]
+        return statements, problems, candidates
+
+    def _candidates(self, shape: QueryShape, plan, problems):
+        scanned = set()
+        sorts = set()
+        for detail in plan:
+            scan = PLAN_SCAN.match(detail)
+            automatic = PLAN_AUTOMATIC_INDEX.match(detail)
+            sort = PLAN_TEMP_SORT.search(detail)
+            if scan:
+                table = shape.aliases.get((scan.group(2) or scan.group(1)).lower())
+                if table:
+                    scanned.add(table)
+                    problems[("full scan", table)] += 1
+            elif automatic:
+                table = shape.aliases.get((automatic.group(2) or automatic.group(1)).lower())
+                columns = [term.split('=')[0].strip() for term in automatic.group(3).split(' AND ')]
+                if table:
+                    problems[("automatic index", table)] += 1
+                    yield table, [c for c in columns if c in self.table_columns[table]], "automatic index"
+            elif sort:
+                sorts.add(sort.group(1))
+                problems[(f"temp b-tree for {sort.group(1).lower()}", None)] += 1
+
+        for table in sorted(set(shape.aliases.values())):
+            equality = shape.for_table("equality", table)
+            ranges = shape.for_table("ranges", table)
+            order = shape.for_table("order", table)
+            group = shape.for_table("group", table)
+            if "ORDER BY" in sorts and order and len(order) == len(shape.order):
+                # Equality columns first leave rows in index order for the sort.
+                yield table, equality + [c for c in order if c not in equality], "sort"
+            elif "GROUP BY" in sorts and group and len(group) == len(shape.group):
+                yield table, equality + [c for c in group if c not in equality], "group by"
+            elif table in scanned and (equality or ranges):
+                yield table, equality + ranges[:1], "filter"
+            elif table in scanned and not shape.group:
+                for column in shape.for_table("min_max", table):
+                    yield table, [column], "min/max"
+
+    def estimate(self, statements, candidates, repeats: int = TIMING_REPEATS):
+        """Time each candidate's statements on a scratch copy with and without the index."""
+        if self.connections.dialect != 'sqlite' or not candidates:
+            return
+        path = self.connections.url.database
+        if not path or path == ':memory:':
+            return
+        source = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        scratch = sqlite3.connect(":memory:")
+        try:
+            source.backup(scratch)
+        finally:
+            source.close()
+        quote = self.connections.engine.dialect.identifier_preparer.quote
+
+        def timed(sql):
+            best = None
+            for _ in range(repeats):
+                started = time.perf_counter()
+                scratch.execute(sql).fetchall()
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            return best
+
+        try:
+            baseline = {}
+            for key, statement in statements.items():
+                try:
+                    baseline[key] = timed(statement["sql"])
+                except sqlite3.Error:
+                    baseline[key] = None
+            for candidate in candidates.values():
+                column_list = ", ".join(quote(column) for column in candidate["columns"])
+                started = time.perf_counter()
+                scratch.execute(f"CREATE INDEX {quote(candidate['name'])} ON {quote(candidate['table'])} ({column_list})")
+                candidate["build_time"] = time.perf_counter() - started
+                saving = 0.0
+                used = 0
+                for key in candidate["statements"]:
+                    statement = statements[key]
+                    if baseline[key] is None:
+                        continue
+                    plan = [row[-1] for row in scratch.execute(f"EXPLAIN QUERY PLAN {statement['sql']}")]
+                    if any(candidate["name"] in detail for detail in plan):
+                        used += 1
+                    saving += (baseline[key] - timed(statement["sql"])) * statement["count"]
+                candidate["statements_using_index"] = used
+                candidate["estimated_saving"] = saving
+                scratch.execute(f"DROP INDEX {quote(candidate['name'])}")
+        finally:
+            scratch.close()
+
+    def recommend(self, workload, min_saving: float = 0.0):
+        statements, problems, candidates = self.analyze(workload)
+        self.estimate(statements, candidates)
+        ranked = sorted(candidates.values(),
+                        key=lambda c: (c.get("estimated_saving", c["observed_time"]), c["runs"]), reverse=True)
+        recommended = [
+            c for c in ranked
+            if c.get("estimated_saving", min_saving) >= min_saving and c.get("statements_using_index", 1) > 0
+        ]
+        return {
+            "statements": len(statements),
+            "runs": sum(statement["count"] for statement in statements.values()),
+            "problems": [{"problem": problem, "table": table, "statements": count}
+                         for (problem, table), count in problems.most_common()],
+            "candidates": [dict(c, reasons=dict(c["reasons"])) for c in ranked],
+            "recommended": [c["name"] for c in recommended],
+        }
+
+    def apply(self, report):
+        quote = self.connections.engine.dialect.identifier_preparer.quote
+        created = []
+        with self.connections.engine.begin() as conn:
+            for candidate in report["candidates"]:
+                if candidate["name"] not in report["recommended"]:
+                    continue
+                column_list = ", ".join(quote(column) for column in candidate["columns"])
+                exists = "IF NOT EXISTS " if self.connections.dialect in ('sqlite', 'postgresql') else ""
+                conn.exec_driver_sql(
+                    f"CREATE INDEX {exists}{quote(candidate['name'])} ON {quote(candidate['table'])} ({column_list})"
+                )
+                created.append(candidate["name"])
+        return created
+
+
+def print_report(report):
+    print(f"Workload: {report['runs']} runs of {report['statements']} distinct statements")
+    for problem in report["problems"]:
+        table = f" on {problem['table']}" if problem["table"] else ""
+        print(f"  {problem['problem']}{table}: {problem['statements']} statements")
+    if not report["candidates"]:
+        print("No index candidates found.")
+        return
+    print("Candidate indexes:")
+    for candidate in report["candidates"]:
+        marker = "*" if candidate["name"] in report["recommended"] else " "
+        reasons = ", ".join(f"{reason} x{count}" for reason, count in candidate["reasons"].items())
+        line = (f" {marker} {candidate['table']}({', '.join(candidate['columns'])}): "
+                f"{candidate['runs']} runs, {candidate['observed_time'] * 1000:.1f}ms observed [{reasons}]")
+        if "estimated_saving" in candidate:
+            line += (f"; est. saving {candidate['estimated_saving'] * 1000:.1f}ms over the workload, "
+                     f"used by {candidate['statements_using_index']}/{len(candidate['statements'])} statements, "
+                     f"build {candidate['build_time'] * 1000:.1f}ms")
+        print(line)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Propose indexes from the query plans of recorded agent queries.")
+    parser.add_argument('--log', default=WORKLOAD_LOG or 'query_workload.jsonl',
+                        help='Workload log written when QUERY_WORKLOAD_LOG is set')
+    parser.add_argument('--cases', help='Use the reference SQL of a golden-question file as the workload instead')
+    parser.add_argument('--min-saving-ms', type=float, default=1.0,
+                        help='Only recommend indexes saving at least this much over the workload')
+    parser.add_argument('--apply', action='store_true', help='Create the recommended indexes')
+    parser.add_argument('-o', '--output', help='Write the report as JSON to this file')
+    args = parser.parse_args()
+
+    connections = ConnectionManager(os.getenv('DATABASE_URI', 'sqlite:///league_players.db'), warm=False)
+    if args.cases:
+        with open(args.cases) as f:
+            workload = [{"sql": json.loads(line)["sql"]} for line in f if line.strip()]
+    else:
+        workload = load_workload(args.log)
+    if connections.dialect != 'sqlite':
+        print("Plan analysis uses EXPLAIN QUERY PLAN and is only available for SQLite.", file=sys.stderr)
+        sys.exit(1)
+
+    advisor = IndexAdvisor(connections)
+    report = advisor.recommend(workload, min_saving=args.min_saving_ms / 1000)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.apply:
+        for name in advisor.apply(report):
+            print(f"Created index {name}")
@@ -0,0 +1,202 @@
+import ast
+import json
+import re
+
+THINK_OPEN = "<think>"
+THINK_CLOSE = "</think>"
+
+
+def extract_think_tags(text):
+    think_pattern = r'<think>(.*?)</think>'
+    thoughts = re.findall(think_pattern, text, re.DOTALL)
+    return thoughts
+
+
+def remove_think_tags(text):
+    if not text:
+        return ""
+    cleaned = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
+    cleaned = re.sub(r'</think>+', '', cleaned)
+    cleaned = re.sub(r'<think>+', '', cleaned)
+    return cleaned.strip()
+
+
+def _partial_tag_length(text: str) -> int:
+    # Length of the longest suffix of text that could still grow into a tag.
+    for length in range(min(len(text), len(THINK_CLOSE) - 1), 0, -1):
+        suffix = text[-length:]
+        if THINK_OPEN.startswith(suffix) or THINK_CLOSE.startswith(suffix):
+            return length
+    return 0
+
+
+class ThinkTagFilter:
+    def __init__(self):
+        self.buffer = ""
+        self.in_think = False
+        self.started = False
+
+    def _emit(self, text: str) -> str:
+        if not self.started:
+            text = text.lstrip()
+            self.started = bool(text)
+        return text
+
+    def feed(self, chunk: str) -> str:
+        self.buffer += chunk
+        visible = []
+        while self.buffer:
+            if self.in_think:
+                end = self.buffer.find(THINK_CLOSE)
+                if end == -1:
+                    keep = _partial_tag_length(self.buffer)
+                    self.buffer = self.buffer[len(self.buffer) - keep:] if keep else ""
+                    break
+                self.buffer = self.buffer[end + len(THINK_CLOSE):]
+                self.in_think = False
+                continue
+            opening = self.buffer.find(THINK_OPEN)
+            stray = self.buffer.find(THINK_CLOSE)
+            if stray != -1 and (opening == -1 or stray < opening):
+                visible.append(self.buffer[:stray])
+                self.buffer = self.buffer[stray + len(THINK_CLOSE):]
+                continue
+            if opening != -1:
+                visible.append(self.buffer[:opening])
+                self.buffer = self.buffer[opening + len(THINK_OPEN):]
+                self.in_think = True
+                continue
+            keep = _partial_tag_length(self.buffer)
+            visible.append(self.buffer[:len(self.buffer) - keep])
+            self.buffer = self.buffer[len(self.buffer) - keep:]
+            break
+        return self._emit("".join(visible))
+
+    def flush(self) -> str:
+        tail = "" if self.in_think else self.buffer
+        self.buffer = ""
+        return self._emit(tail)
+
+
+FENCED_BLOCK = re.compile(r'```[ \t]*([A-Za-z]*)[ \t]*\n?(.*?)```', re.DOTALL)
+# Statements start a line; a "select" inside a sentence is prose.
+BARE_SQL = re.compile(r'^[ \t]*(?:SELECT|WITH)\b.*?(?:;[ \t]*$|;?(?=[ \t]*\n[ \t]*\n)|\Z)',
+                      re.DOTALL | re.IGNORECASE | re.MULTILINE)
+SQL_SHAPE = re.compile(r'(?:SELECT\b.*\bFROM\b|WITH\s+(?:RECURSIVE\s+)?\w+\s*(?:\([^)]*\)\s*)?AS\s*\()',
+                       re.DOTALL | re.IGNORECASE)
+TRAILING_COMMA = re.compile(r',\s*([}\]])')
+SMART_QUOTES = str.maketrans({'“': '"', '”': '"', '‘': "'", '’': "'"})
+
+
+def _balanced_objects(text: str):
+    # Top-level {...} spans, skipping braces inside string literals.
+    depth = 0
+    start = None
+    quote = None
+    escaped = False
+    for i, char in enumerate(text):
+        if quote:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == quote:
+                quote = None
+            continue
+        if char == '"':
+            quote = char
+        elif char == '{':
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == '}' and depth:
+            depth -= 1
+            if depth == 0:
+                yield text[start:i + 1]
+    if depth and start is not None:
+        # Truncated output: close what is still open and let the repair try it.
+        yield text[start:] + ('"' if quote else '') + '}' * depth
+
+
+def _load_json(candidate: str):
+    try:
+        return json.loads(candidate, strict=False), False
+    except ValueError:
+        pass
+    repaired = TRAILING_COMMA.sub(r'\1', candidate.translate(SMART_QUOTES))
+    try:
+        return json.loads(repaired, strict=False), True
+    except ValueError:
+        pass
+    # Python-literal style output: single quotes, True/False/None.
+    try:
+        value = ast.literal_eval(repaired)
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        return None, False
+    return value, True
+
+
+def _json_candidates(text: str):
+    # (candidate, needs_repair): a bare or fenced object is what was asked
+    # for; an object cut out of surrounding prose is already a repair.
+    yield text, False
+    for language, body in FENCED_BLOCK.findall(text):
+        if language.lower() in ('', 'json'):
+            yield body.strip(), False
+    for candidate in _balanced_objects(text):
+        yield candidate, True
+
+
+def _fenced_sql(text: str):
+    blocks = [body.strip() for language, body in FENCED_BLOCK.findall(text)
+              if language.lower() in ('', 'sql', 'sqlite', 'postgresql', 'mysql', 'tsql')]
+    blocks = [block for block in blocks if re.match(r'(SELECT|WITH)\b', block, re.IGNORECASE)]
+    return ";\n".join(block.rstrip().rstrip(';') for block in blocks)
+
+
+def _bare_sql(text: str):
+    statements = []
+    position = 0
+    while True:
+        match = BARE_SQL.search(text, position)
+        if match is None:
+            break
+        statement = match.group(0).strip()
+        if SQL_SHAPE.match(statement):
+            statements.append(statement.rstrip(';'))
+            position = match.end()
+        else:
+            # A prose line that happens to start with "select"/"with": look
+            # for a statement from the next line on.
+            position = text.find('\n', match.start()) + 1
+            if position == 0:
+                break
+    return ";\n".join(statements)
+
+
+def parse_reasoning_output(text: str):
+    """Recover {"reasoning", "query"} from a model reply without another model call.
+
+    Returns (result, method); method is "json" for clean output, otherwise the
+    repair that produced the result ("repaired_json", "fenced_sql", "bare_sql")
+    or "failed" when no query could be found.
+    """
+    text = text or ""
+    thoughts = "\n".join(thought.strip() for thought in extract_think_tags(text))
+    visible = remove_think_tags(text)
+    for candidate, extracted in _json_candidates(visible):
+        value, repaired = _load_json(candidate)
+        if isinstance(value, dict) and isinstance(value.get("query"), str) and value["query"].strip():
+            return {
+                "reasoning": str(value.get("reasoning") or thoughts or "No reasoning provided"),
+                "query": value["query"].strip(),
+            }, "repaired_json" if repaired or extracted else "json"
+
+    reasoning = thoughts or visible or "No reasoning provided"
+    query = _fenced_sql(visible)
+    if query:
+        return {"reasoning": reasoning, "query": query}, "fenced_sql"
+    query = _bare_sql(visible)
+    if query:
+        return {"reasoning": reasoning, "query": query}, "bare_sql"
+    return {"reasoning": reasoning, "query": ""}, "failed"
@@ -1,11 +1,12 @@
-import streamlit as st
-from chat import run_react_agent, graph
-import io
-import sys
-import subprocess
+import queue
+import threading
 import time
-import re
-from contextlib import redirect_stdout
+
+import streamlit as st
+from chat import describe_step, get_default_runtime, stream_react_agent
+from pipeline import CancelToken
+from llm_output import remove_think_tags
+from ollama_manager import get_ollama_manager
 
 st.set_page_config(
     page_title="ReAct SQL Agent",
@@ -25,34 +26,11 @@ header {visibility: hidden;}
 """
 st.markdown(hide_streamlit_style, unsafe_allow_html=True)
 
-def start_ollama():
-    try:
-        result = subprocess.run(["ollama", "list"], capture_output=True, text=True, timeout=10)
-        if "qwen3" not in result.stdout:
-            st.info("Starting Ollama with qwen3 model...")
-            subprocess.Popen(["ollama", "run", "qwen3"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            time.sleep(5)
-        return True
-    except Exception as e:
-        st.error(f"Could not start Ollama: {e}")
-        return False
-
-def remove_think_tags(text):
-    if not text:
-        return ""
-    cleaned = re.sub(r'<think>.*?</think>', '', text, flags=re.DOTALL).strip()
-    cleaned = re.sub(r'</think>+', '', cleaned)
-    cleaned = re.sub(r'<think>+', '', cleaned)
-    return cleaned.strip()
-
 st.title("ReAct Text-to-SQL Agent")
 
 if "messages" not in st.session_state:
     st.session_state.messages = []
 
-if "ollama_started" not in st.session_state:
-    st.session_state.ollama_started = False
-
 if "is_thinking" not in st.session_state:
     st.session_state.is_thinking = False
 
@@ -62,71 +40,114 @@ if "current_question" not in st.session_state:
 if "question_being_processed" not in st.session_state:
     st.session_state.question_being_processed = False
 
-if not st.session_state.ollama_started:
-    if start_ollama():
-        st.session_state.ollama_started = True
-        st.success("Ollama started successfully!")
+if "cancel_token" not in st.session_state:
+    st.session_state.cancel_token = None
+
+@st.cache_resource
+def start_agent_runtime():
+    # Pools, schema and model client load off the script thread, so the page
+    # draws and Ollama starts meanwhile; an early question waits on the same lock.
+    thread = threading.Thread(target=get_default_runtime, name="agent-runtime", daemon=True)
+    thread.start()
+    return thread
+
+start_agent_runtime()
+
+ollama = get_ollama_manager()
+if ollama.state != 'ready':
+    with st.spinner(f"Starting Ollama with {ollama.model}..."):
+        ready = ollama.ensure_ready()
+    if ready:
+        if ollama.load_time is not None:
+            st.success(f"Ollama is ready ({ollama.model} loaded in {ollama.load_time:.1f}s)")
     else:
-        st.error("Failed to start Ollama. Please make sure it's installed and accessible.")
-
-def capture_agent_output(question):
-    f = io.StringIO()
-    with redirect_stdout(f):
-        run_react_agent(question)
-    return f.getvalue()
+        st.error(f"Failed to start Ollama: {ollama.error}. Please make sure it's installed and accessible.")
+
+def cancel_question():
+    # Runs at the start of the rerun the click triggers; the token is shared
+    # with the run still in flight, whose statement is interrupted.
+    if st.session_state.cancel_token is not None:
+        st.session_state.cancel_token.cancel()
+    st.session_state.messages.append({"role": "assistant", "content": "Query cancelled."})
+    st.session_state.is_thinking = False
+    st.session_state.current_question = None
+    st.session_state.question_being_processed = False
 
-def parse_agent_output(output):
+def answer_question(question, on_token, cancel_token, on_wait):
+    # The agent runs on a worker thread while this script thread keeps calling
+    # on_wait. Streamlit only stops a run for a pending rerun inside an st.*
+    # call, so this is what lets a Cancel click reach cancel_question (and the
+    # token) while a statement is still running.
+    events = queue.Queue()
+
+    def produce():
+        try:
+            for event in stream_react_agent(question, cancel_token):
+                events.put(event)
+        except Exception as e:
+            events.put(e)
+        finally:
+            events.put(None)
+
+    threading.Thread(target=produce, name="agent-question", daemon=True).start()
     sections = {}
-    current_section = None
-    current_content = []
-    
-    for line in output.split('\n'):
-        line = line.strip()
-        if not line:
+    answer = None
+    results = []
+    while True:
+        try:
+            event = events.get(timeout=0.2)
+        except queue.Empty:
+            on_wait()
             continue
-            
-        if line.startswith('REASONING STEP:'):
-            if current_section and current_content:
-                sections[current_section] = '\n'.join(current_content)
-            current_section = 'REASONING STEP:'
-            current_content = []
-        elif line.startswith('VALIDATION STEP:'):
-            if current_section and current_content:
-                sections[current_section] = '\n'.join(current_content)
-            current_section = 'VALIDATION STEP:'
-            current_content = []
-        elif line.startswith('EXECUTION STEP:'):
-            if current_section and current_content:
-                sections[current_section] = '\n'.join(current_content)
-            current_section = 'EXECUTION STEP:'
-            current_content = []
-        elif line.startswith('FINAL ANSWER:'):
-            if current_section and current_content:
-                sections[current_section] = '\n'.join(current_content)
-            current_section = 'FINAL ANSWER:'
-            current_content = []
-        elif current_section:
-            current_content.append(line)
-    
-    if current_section and current_content:
-        sections[current_section] = '\n'.join(current_content)
-    
-    return sections
+        if event is None:
+            break
+        if isinstance(event, Exception):
+            raise event
+        if event["type"] == "token":
+            on_token(event["payload"]["token"])
+            continue
+        if event["type"] == "cancelled":
+            answer = "Query cancelled."
+            continue
+        payload = event["payload"]
+        if event["node"] == "execute_final_query":
+            results = payload.get("results", [])
+        elif event["node"] == "generate_final_answer":
+            answer = payload.get("answer")
+        described = describe_step(event)
+        if described:
+            title, lines = described
+            sections[title] = {"content": "\n\n".join(lines), "elapsed": event["elapsed"]}
+    return answer, sections, results
+
+def render_query_results(results):
+    for i, result in enumerate(results, 1):
+        if "error" in result or not result.get("columns"):
+            continue
+        label = f"📊 Query {i} results ({result['row_count']} rows)" if len(results) > 1 else f"📊 Query results ({result['row_count']} rows)"
+        with st.expander(label, expanded=False):
+            st.dataframe([dict(zip(result["columns"], row)) for row in result["rows"]])
+            if result["truncated"]:
+                st.caption(f"Showing the first {len(result['rows'])} of {result['row_count']} rows.")
 
-def render_message_details(sections, message_index):
+def render_message_details(sections, message_index, results=None):
     if not sections:
         return
     
     st.write("---")
     st.write("**Model's Reasoning Process:**")
     
-    for section_name, content in sections.items():
+    for section_name, section in sections.items():
         if section_name == "FINAL ANSWER:":
             continue
             
-        if content and content.strip():
-            with st.expander(f"📋 {section_name}", expanded=False):
-                st.markdown(content.strip())
+        content = section["content"].strip()
+        if content:
+            with st.expander(f"📋 {section_name} ({section['elapsed']:.2f}s)", expanded=False):
+                st.markdown(content)
+    
+    if results:
+        render_query_results(results)
 
 with st.form("chat_form", clear_on_submit=True):
     question = st.text_input(
@@ -144,7 +165,7 @@ for i, message in enumerate(st.session_state.messages):
         st.write(message["content"])
         
         if message["role"] == "assistant" and "sections" in message:
-            render_message_details(message["sections"], i)
+            render_message_details(message["sections"], i, message.get("results"))
 
 if submitted and question and not st.session_state.question_being_processed:
     st.session_state.current_question = question
@@ -160,21 +181,37 @@ if st.session_state.is_thinking and st.session_state.current_question:
         st.write(st.session_state.current_question)
     
     with st.chat_message("assistant"):
+        st.session_state.cancel_token = CancelToken()
+        st.button("Cancel", on_click=cancel_question)
         with st.spinner("Thinking..."):
             try:
-                output = capture_agent_output(st.session_state.current_question)
-                sections = parse_agent_output(output)
+                answer_placeholder = st.empty()
+                progress_placeholder = st.empty()
+                streamed_tokens = []
+                started = time.perf_counter()
+                
+                def show_token(token):
+                    streamed_tokens.append(token)
+                    answer_placeholder.markdown("".join(streamed_tokens))
+                
+                def show_progress():
+                    progress_placeholder.caption(f"Working... {time.perf_counter() - started:.0f}s")
                 
-                final_answer = sections.get("FINAL ANSWER:", "No answer generated")
-                clean_final_answer = remove_think_tags(final_answer)
+                ollama.ensure_ready()
+                final_answer, sections, query_results = answer_question(
+                    st.session_state.current_question, show_token, st.session_state.cancel_token, show_progress
+                )
+                progress_placeholder.empty()
+                clean_final_answer = remove_think_tags(final_answer or "No answer generated")
                 
-                st.write(clean_final_answer)
-                render_message_details(sections, len(st.session_state.messages))
+                answer_placeholder.write(clean_final_answer)
+                render_message_details(sections, len(st.session_state.messages), query_results)
                 
                 st.session_state.messages.append({
                     "role": "assistant", 
                     "content": clean_final_answer,
-                    "sections": sections
+                    "sections": sections,
+                    "results": query_results
                 })
                 
             except Exception as e:
@@ -187,9 +224,9 @@ if st.session_state.is_thinking and st.session_state.current_question:
     st.session_state.is_thinking = False
     st.session_state.current_question = None
     st.session_state.question_being_processed = False
+    st.session_state.cancel_token = None
     st.rerun()
 
 if st.button("Clear History"):
     st.session_state.messages = []
-    st.session_state.ollama_started = False
     st.rerun() 
\ No newline at end of file
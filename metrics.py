@@ -0,0 +1,326 @@
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+TOKEN_BUCKETS = (16, 64, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+_current_span = contextvars.ContextVar("metrics_span", default=None)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, fraction: float):
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "buckets": dict(zip([str(b) for b in self.buckets] + ["+Inf"], self.counts)),
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class Span:
+    def __init__(self, kind: str, name: str, parent=None):
+        self.kind = kind
+        self.name = name
+        self.parent = parent
+        self.db_time = 0.0
+        self.llm_time = 0.0
+        self.cache_hits = 0
+        self.rows = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    def add(self, field: str, amount):
+        # Statements of one node can run on several threads at once, and the
+        # figures roll up into every enclosing span (tool -> node).
+        span = self
+        while span is not None:
+            with span._lock:
+                setattr(span, field, getattr(span, field) + amount)
+            span = span.parent
+
+
+class Metrics:
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.listeners = []
+        self._lock = threading.Lock()
+        events_path = os.getenv('METRICS_EVENTS_FILE')
+        if events_path:
+            self.subscribe(JsonlEventWriter(events_path))
+
+    def subscribe(self, listener):
+        with self._lock:
+            self.listeners.append(listener)
+
+    def unsubscribe(self, listener):
+        with self._lock:
+            if listener in self.listeners:
+                self.listeners.remove(listener)
+
+    def emit(self, event: dict):
+        for listener in list(self.listeners):
+            try:
+                listener(event)
+            except Exception:
+                pass
+
+    def increment(self, name: str, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self.counters.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), **histogram.to_dict()}
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+            }
+
+    def prometheus_text(self) -> str:
+        def render_labels(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self.counters.items()):
+                lines.append(f"{name}{render_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{render_labels(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_bucket{render_labels(labels, [('le', '+Inf')])} {histogram.count}")
+                lines.append(f"{name}_sum{render_labels(labels)} {histogram.total}")
+                lines.append(f"{name}_count{render_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+
+class JsonlEventWriter:
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event: dict):
+        with self._lock, open(self.path, 'a') as f:
+            f.write(json.dumps(event, default=str) + "\n")
+
+
+metrics = Metrics()
+
+
+def current_span():
+    return _current_span.get()
+
+
+def _add(field: str, amount):
+    span = _current_span.get()
+    if span is not None:
+        span.add(field, amount)
+
+
+@contextmanager
+def db_timer():
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _add("db_time", time.perf_counter() - started)
+
+
+class LLMCall:
+    """Token usage and timing of one model call, fed the chunks as they arrive.
+
+    The wait for the first chunk is the time to first token. It includes
+    prompt processing, but for qwen3 the first tokens are <think> text, so it
+    is not the prompt-eval time alone. The rest of the call is generation.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.started = time.perf_counter()
+        self.first_chunk = None
+        self.finished = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def observe(self, message):
+        if self.first_chunk is None and message.content:
+            self.first_chunk = time.perf_counter()
+        # Streamed responses report usage once, on the last chunk.
+        usage = getattr(message, "usage_metadata", None) or {}
+        self.prompt_tokens += usage.get("input_tokens", 0)
+        self.completion_tokens += usage.get("output_tokens", 0)
+
+    @property
+    def time_to_first_token(self) -> float:
+        return (self.first_chunk or self.finished) - self.started
+
+    @property
+    def generation_time(self) -> float:
+        return self.finished - (self.first_chunk or self.finished)
+
+
+@contextmanager
+def llm_call(name: str):
+    call = LLMCall(name)
+    try:
+        yield call
+    finally:
+        call.finished = time.perf_counter()
+        _add("llm_time", call.finished - call.started)
+        _add("prompt_tokens", call.prompt_tokens)
+        _add("completion_tokens", call.completion_tokens)
+        metrics.increment("agent_llm_tokens_total", call.prompt_tokens, call=name, kind="prompt")
+        metrics.increment("agent_llm_tokens_total", call.completion_tokens, call=name, kind="completion")
+        metrics.observe("agent_llm_prompt_tokens", call.prompt_tokens, buckets=TOKEN_BUCKETS, call=name)
+        metrics.observe("agent_llm_completion_tokens", call.completion_tokens, buckets=TOKEN_BUCKETS, call=name)
+        metrics.observe("agent_llm_time_to_first_token_seconds", call.time_to_first_token, call=name)
+        metrics.observe("agent_llm_generation_seconds", call.generation_time, call=name)
+        metrics.emit({
+            "type": "llm",
+            "name": name,
+            "timestamp": time.time(),
+            "prompt_tokens": call.prompt_tokens,
+            "completion_tokens": call.completion_tokens,
+            "time_to_first_token": call.time_to_first_token,
+            "generation_time": call.generation_time,
+        })
+
+
+def add_rows(count: int):
+    _add("rows", count)
+
+
+def record_cache(cache: str, hit: bool):
+    metrics.increment("agent_cache_lookups_total", cache=cache, result="hit" if hit else "miss")
+    if hit:
+        _add("cache_hits", 1)
+
+
+def _finish(span: Span, started: float, error):
+    wall_time = time.perf_counter() - started
+    labels = {span.kind: span.name}
+    metrics.increment(f"agent_{span.kind}_runs_total", **labels)
+    if error is not None:
+        metrics.increment(f"agent_{span.kind}_errors_total", **labels)
+    metrics.observe(f"agent_{span.kind}_wall_seconds", wall_time, **labels)
+    metrics.observe(f"agent_{span.kind}_db_seconds", span.db_time, **labels)
+    metrics.observe(f"agent_{span.kind}_llm_seconds", span.llm_time, **labels)
+    metrics.observe(f"agent_{span.kind}_rows", span.rows, buckets=ROW_BUCKETS, **labels)
+    metrics.emit({
+        "type": span.kind,
+        "name": span.name,
+        "timestamp": time.time(),
+        "wall_time": wall_time,
+        "db_time": span.db_time,
+        "llm_time": span.llm_time,
+        "cache_hits": span.cache_hits,
+        "rows": span.rows,
+        "prompt_tokens": span.prompt_tokens,
+        "completion_tokens": span.completion_tokens,
+        "error": None if error is None else f"{type(error).__name__}: {error}",
+    })
+
+
+def instrument(kind: str, name: str):
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                span = Span(kind, name, parent=_current_span.get())
+                token = _current_span.set(span)
+                started = time.perf_counter()
+                error = None
+                try:
+                    return await fn(*args, **kwargs)
+                except Exception as e:
+                    error = e
+                    raise
+                finally:
+                    _current_span.reset(token)
+                    _finish(span, started, error)
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            span = Span(kind, name, parent=_current_span.get())
+            token = _current_span.set(span)
+            started = time.perf_counter()
+            error = None
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                error = e
+                raise
+            finally:
+                _current_span.reset(token)
+                _finish(span, started, error)
+        return wrapper
+    return decorator
+
+
+def instrument_node(name: str):
+    return instrument("node", name)
+
+
+def instrument_tool(name: str):
+    return instrument("tool", name)
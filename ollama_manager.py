@@ -0,0 +1,157 @@
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+
+OLLAMA_HOST = os.getenv('OLLAMA_HOST_URL', 'http://localhost:11434')
+OLLAMA_MODEL = os.getenv('OLLAMA_MODEL', 'qwen3')
+OLLAMA_KEEP_ALIVE = os.getenv('OLLAMA_KEEP_ALIVE', '30m')
+STARTUP_TIMEOUT = float(os.getenv('OLLAMA_STARTUP_TIMEOUT', '60'))
+WARMUP_TIMEOUT = float(os.getenv('OLLAMA_WARMUP_TIMEOUT', '300'))
+# How long a successful readiness check is trusted before probing again.
+READY_RECHECK_SECONDS = 30.0
+
+
+class OllamaManager:
+    def __init__(self, host: str = OLLAMA_HOST, model: str = OLLAMA_MODEL, keep_alive: str = OLLAMA_KEEP_ALIVE,
+                 startup_timeout: float = STARTUP_TIMEOUT, poll_interval: float = 0.25):
+        self.host = host.rstrip('/')
+        self.model = model
+        self.keep_alive = keep_alive
+        self.startup_timeout = startup_timeout
+        self.poll_interval = poll_interval
+        self.state = 'unknown'
+        self.error = None
+        self.server_started_here = False
+        self.server_wait_time = None
+        self.load_time = None
+        self.last_ready_check = 0.0
+        self._process = None
+        self._lock = threading.Lock()
+
+    @property
+    def openai_base_url(self) -> str:
+        return f"{self.host}/v1"
+
+    def _request(self, path: str, payload=None, timeout: float = 2.0):
+        data = json.dumps(payload).encode() if payload is not None else None
+        request = urllib.request.Request(
+            f"{self.host}{path}",
+            data=data,
+            headers={"Content-Type": "application/json"} if data else {},
+        )
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read() or b"{}")
+
+    def is_serving(self) -> bool:
+        try:
+            self._request("/v1/models")
+            return True
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+
+    def _matches(self, name: str) -> bool:
+        return name == self.model or name.split(':')[0] == self.model
+
+    def has_model(self) -> bool:
+        models = self._request("/v1/models").get("data", [])
+        return any(self._matches(entry.get("id", "")) for entry in models)
+
+    def is_loaded(self) -> bool:
+        try:
+            running = self._request("/api/ps").get("models", [])
+        except (urllib.error.URLError, OSError, ValueError):
+            return False
+        return any(self._matches(entry.get("name", "")) for entry in running)
+
+    def start_server(self):
+        if shutil.which("ollama") is None:
+            raise RuntimeError("ollama executable not found on PATH")
+        env = dict(os.environ, OLLAMA_KEEP_ALIVE=self.keep_alive)
+        self._process = subprocess.Popen(
+            ["ollama", "serve"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env
+        )
+        self.server_started_here = True
+
+    def wait_until_serving(self, timeout: float = None) -> bool:
+        deadline = time.monotonic() + (timeout if timeout is not None else self.startup_timeout)
+        while time.monotonic() < deadline:
+            if self.is_serving():
+                return True
+            if self._process is not None and self._process.poll() is not None:
+                return False
+            time.sleep(self.poll_interval)
+        return False
+
+    def pull_model(self):
+        subprocess.run(["ollama", "pull", self.model], check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    def warm_up(self):
+        started = time.monotonic()
+        response = self._request("/api/generate", {
+            "model": self.model,
+            "prompt": "Hi",
+            "stream": False,
+            "keep_alive": self.keep_alive,
+            "options": {"num_predict": 1},
+        }, timeout=WARMUP_TIMEOUT)
+        # Ollama reports the model load itself in nanoseconds; fall back to
+        # wall time if an older server leaves it out.
+        load_duration = response.get("load_duration")
+        self.load_time = load_duration / 1e9 if load_duration else time.monotonic() - started
+
+    def ensure_ready(self) -> bool:
+        with self._lock:
+            if self.state == 'ready' and time.monotonic() - self.last_ready_check < READY_RECHECK_SECONDS:
+                return True
+            try:
+                if not self.is_serving():
+                    self.state = 'starting'
+                    started = time.monotonic()
+                    self.start_server()
+                    if not self.wait_until_serving():
+                        raise RuntimeError(f"Ollama did not answer on {self.host} within {self.startup_timeout:.0f}s")
+                    self.server_wait_time = time.monotonic() - started
+                if not self.has_model():
+                    self.state = 'pulling'
+                    self.pull_model()
+                if not self.is_loaded():
+                    self.state = 'loading'
+                    self.warm_up()
+                self.state = 'ready'
+                self.error = None
+                self.last_ready_check = time.monotonic()
+                return True
+            except Exception as e:
+                self.state = 'failed'
+                self.error = str(e)
+                return False
+
+    def status(self) -> dict:
+        return {
+            "state": self.state,
+            "model": self.model,
+            "host": self.host,
+            "keep_alive": self.keep_alive,
+            "server_started_here": self.server_started_here,
+            "server_wait_time": self.server_wait_time,
+            "load_time": self.load_time,
+            "error": self.error,
+        }
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_ollama_manager() -> OllamaManager:
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = OllamaManager()
+        return _manager
@@ -0,0 +1,271 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from sqlalchemy.exc import DBAPIError
+
+from connections import ConnectionManager
+
+QUERY_TIMEOUT = float(os.getenv('QUERY_TIMEOUT', '30'))
+QUERY_MAX_ROWS = int(os.getenv('QUERY_MAX_ROWS', '1000000'))
+# SQLite calls the progress handler every this many VM instructions; small
+# enough to stop a runaway join within milliseconds, large enough to be free.
+SQLITE_PROGRESS_STEPS = 1000
+
+# SQLite asks the authorizer about every table, column and function while it
+# compiles a statement, so denying anything but reads rejects writes, DDL,
+# PRAGMA and ATTACH before a single row is touched.
+SQLITE_READ_ONLY_ACTIONS = {
+    sqlite3.SQLITE_SELECT,
+    sqlite3.SQLITE_READ,
+    sqlite3.SQLITE_FUNCTION,
+    sqlite3.SQLITE_RECURSIVE,
+}
+
+READ_ONLY_TRANSACTION = {
+    'postgresql': "SET TRANSACTION READ ONLY",
+    'mysql': "SET TRANSACTION READ ONLY",
+}
+
+# SQL Server has no read-only transaction mode, so it keeps the keyword check.
+WRITE_PATTERNS = [
+    r'\bDROP\s+',
+    r'\bDELETE\s+',
+    r'\bUPDATE\s+.*\s+SET\b',
+    r'\bINSERT\s+INTO\b',
+    r'\bCREATE\s+',
+    r'\bALTER\s+',
+    r'\bTRUNCATE\s+',
+    r'\bMERGE\s+',
+    r'\bEXEC(UTE)?\s+',
+]
+
+
+def _sqlite_read_only_authorizer(action, arg1, arg2, db_name, trigger):
+    if action in SQLITE_READ_ONLY_ACTIONS:
+        return sqlite3.SQLITE_OK
+    return sqlite3.SQLITE_DENY
+
+
+class QueryError(Exception):
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        self.kind = kind
+
+    def __str__(self):
+        labels = {
+            'read_only': "Query rejected (read-only access)",
+            'syntax': "SQL syntax error",
+            'execution': "Query execution failed",
+            'timeout': "Query timed out",
+            'cancelled': "Query cancelled",
+            'row_limit': "Query returned too many rows",
+        }
+        return f"{labels.get(self.kind, 'Query failed')}: {self.args[0]}"
+
+
+def classify_error(message: str) -> str:
+    lowered = message.lower()
+    if 'statement timeout' in lowered or 'execution time exceeded' in lowered or 'timeout expired' in lowered:
+        return 'timeout'
+    if 'interrupted' in lowered or 'due to user request' in lowered:
+        return 'cancelled'
+    if 'not authorized' in lowered or 'read-only' in lowered or 'read only' in lowered:
+        return 'read_only'
+    if 'syntax' in lowered or 'no such' in lowered or 'does not exist' in lowered or 'unknown column' in lowered:
+        return 'syntax'
+    return 'execution'
+
+
+class CancelToken:
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            self._event.set()
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                pass
+
+    def register(self, callback):
+        # Returns a function that unregisters the callback again.
+        with self._lock:
+            already_cancelled = self._event.is_set()
+            if not already_cancelled:
+                self._callbacks.append(callback)
+        if already_cancelled:
+            callback()
+
+        def unregister():
+            with self._lock:
+                if callback in self._callbacks:
+                    self._callbacks.remove(callback)
+        return unregister
+
+
+class QueryBudget:
+    def __init__(self, timeout: float, cancel_token: CancelToken = None):
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout
+        self.cancel_token = cancel_token
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - time.monotonic())
+
+    def exceeded(self):
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            return 'cancelled'
+        if time.monotonic() >= self.deadline:
+            return 'timeout'
+        return None
+
+    def error(self, kind: str) -> QueryError:
+        if kind == 'timeout':
+            return QueryError('timeout', f"stopped after the {self.timeout:g}s limit")
+        return QueryError('cancelled', "stopped at the user's request")
+
+
+class QueryPipeline:
+    def __init__(self, connections: ConnectionManager, batch_size: int = 500):
+        self.connections = connections
+        self.dialect = connections.dialect
+        self.batch_size = batch_size
+
+    def _enter_read_only(self, conn):
+        if self.dialect == 'sqlite':
+            conn.connection.dbapi_connection.set_authorizer(_sqlite_read_only_authorizer)
+        elif self.dialect in READ_ONLY_TRANSACTION:
+            conn.exec_driver_sql(READ_ONLY_TRANSACTION[self.dialect])
+
+    def _exit_read_only(self, conn):
+        if self.dialect == 'sqlite':
+            conn.connection.dbapi_connection.set_authorizer(None)
+
+    def _enter_limits(self, conn, budget: QueryBudget):
+        dbapi_connection = conn.connection.dbapi_connection
+        milliseconds = max(1, int(budget.remaining() * 1000))
+        if self.dialect == 'sqlite':
+            dbapi_connection.set_progress_handler(lambda: 1 if budget.exceeded() else 0, SQLITE_PROGRESS_STEPS)
+        elif self.dialect == 'postgresql':
+            conn.exec_driver_sql(f"SET LOCAL statement_timeout = {milliseconds}")
+        elif self.dialect == 'mysql':
+            conn.exec_driver_sql(f"SET SESSION MAX_EXECUTION_TIME = {milliseconds}")
+        elif self.dialect == 'mssql':
+            dbapi_connection.timeout = max(1, math.ceil(budget.remaining()))
+
+    def _exit_limits(self, conn):
+        dbapi_connection = conn.connection.dbapi_connection
+        if self.dialect == 'sqlite':
+            dbapi_connection.set_progress_handler(None, 0)
+        elif self.dialect == 'mysql':
+            conn.exec_driver_sql("SET SESSION MAX_EXECUTION_TIME = 0")
+        elif self.dialect == 'mssql':
+            dbapi_connection.timeout = 0
+        # PostgreSQL's SET LOCAL ends with the transaction.
+
+    def _interrupter(self, conn):
+        # Called from another thread when the run is cancelled.
+        dbapi_connection = conn.connection.dbapi_connection
+        if self.dialect == 'sqlite':
+            return dbapi_connection.interrupt
+        if self.dialect == 'postgresql':
+            return dbapi_connection.cancel
+        if self.dialect == 'mysql':
+            connection_id = conn.exec_driver_sql("SELECT CONNECTION_ID()").scalar()
+
+            def kill_query():
+                with self.connections.connect() as killer:
+                    killer.exec_driver_sql(f"KILL QUERY {int(connection_id)}")
+            return kill_query
+        # pyodbc can only cancel from the cursor, which the driver owns until
+        # execute returns; the timeout and the checks between batches apply.
+        return None
+
+    def check_statement(self, sql: str):
+        if self.dialect == 'sqlite' or self.dialect in READ_ONLY_TRANSACTION:
+            return
+        upper = sql.upper()
+        for pattern in WRITE_PATTERNS:
+            if re.search(pattern, upper):
+                raise QueryError('read_only', f"statement matches {pattern}")
+
+    def iter_batches(self, sql: str, max_rows: int = None, timeout: float = None,
+                     row_budget: int = None, cancel_token: CancelToken = None):
+        # max_rows stops quietly (a test run); row_budget fails the query.
+        sql = sql.strip().rstrip(';').strip()
+        if not sql:
+            raise QueryError('syntax', "query is empty")
+        self.check_statement(sql)
+        budget = QueryBudget(QUERY_TIMEOUT if timeout is None else timeout, cancel_token)
+        row_budget = QUERY_MAX_ROWS if row_budget is None else row_budget
+        if budget.exceeded():
+            raise budget.error(budget.exceeded())
+        with self.connections.connect() as conn:
+            unregister = None
+            try:
+                self._enter_read_only(conn)
+                self._enter_limits(conn, budget)
+                interrupt = self._interrupter(conn) if cancel_token is not None else None
+                if interrupt is not None:
+                    unregister = cancel_token.register(interrupt)
+                # One execute() prepares the statement and starts stepping it;
+                # the rows are then pulled from that same cursor in batches.
+                result = conn.exec_driver_sql(sql, execution_options={"no_parameters": True})
+                if not result.returns_rows:
+                    yield [], []
+                    return
+                columns = list(result.keys())
+                fetched = 0
+                while True:
+                    size = self.batch_size
+                    if max_rows is not None:
+                        size = min(size, max_rows - fetched)
+                        if size <= 0:
+                            break
+                    batch = result.fetchmany(size)
+                    exceeded = budget.exceeded()
+                    if exceeded:
+                        raise budget.error(exceeded)
+                    if not batch:
+                        break
+                    fetched += len(batch)
+                    if max_rows is None and fetched > row_budget:
+                        raise QueryError('row_limit', f"more than {row_budget} rows; add a filter, GROUP BY or LIMIT")
+                    yield columns, [tuple(row) for row in batch]
+                if fetched == 0:
+                    yield columns, []
+                result.close()
+            except DBAPIError as e:
+                message = str(e.orig)
+                # An interrupted statement surfaces as a driver error; report
+                # why it was interrupted rather than what the driver said.
+                kind = budget.exceeded()
+                if kind:
+                    raise budget.error(kind) from e
+                raise QueryError(classify_error(message), message) from e
+            finally:
+                if unregister is not None:
+                    unregister()
+                self._exit_limits(conn)
+                self._exit_read_only(conn)
+                conn.rollback()
+
+    def run(self, sql: str, max_rows: int = None, cancel_token: CancelToken = None):
+        columns = []
+        rows = []
+        for columns, batch in self.iter_batches(sql, max_rows=max_rows, cancel_token=cancel_token):
+            rows.extend(batch)
+        return columns, rows
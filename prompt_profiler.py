@@ -0,0 +1,156 @@
+import argparse
+import json
+import re
+import statistics
+import sys
+
+from chat import AgentRuntime, combine_statement_results, initial_state, split_statements
+from results import format_answer
+
+SAMPLE_ROWS = re.compile(r'\n?/\*\n\d+ rows from .*? table:\n.*?\*/\n?', re.DOTALL)
+CHARS_PER_TOKEN = 4
+
+
+class TokenCounter:
+    # tiktoken's encodings are close to qwen3's for English and SQL. Without
+    # them (they are downloaded on first use) fall back to a character estimate.
+    def __init__(self):
+        self.method = "chars/4"
+        self._encoding = None
+        try:
+            import tiktoken
+            self._encoding = tiktoken.get_encoding("cl100k_base")
+            self.method = "cl100k_base"
+        except Exception:
+            pass
+
+    def __call__(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        return max(1, round(len(text) / CHARS_PER_TOKEN))
+
+
+def template_text(template, **values) -> str:
+    # The template's fixed text: every variable filled with the given value, or left empty.
+    names = {name: "" for name in template.input_variables}
+    names.update(values)
+    return "\n".join(str(message.content) for message in template.invoke(names).to_messages())
+
+
+def reasoning_components(runtime: AgentRuntime, question: str) -> dict:
+    table_info = runtime.select_table_info(question)
+    sample_rows = "".join(SAMPLE_ROWS.findall(table_info))
+    guidelines = runtime.schema_cache.get(("derived_column_guidelines",), runtime.derived_column_guidelines)
+    return {
+        "instructions": template_text(runtime.reasoning_prompt, dialect=runtime.connections.dialect),
+        "guidelines": guidelines,
+        "schema": SAMPLE_ROWS.sub("", table_info),
+        "sample_rows": sample_rows,
+        "question": question,
+    }
+
+
+def answer_components(runtime: AgentRuntime, question: str, sql: str):
+    outcomes = [runtime.run_statement(statement) for statement in split_statements(sql)]
+    combined = combine_statement_results(outcomes)
+    # Results answered on the fast path never reach the model.
+    if format_answer(question, combined["results"]) is not None:
+        return None
+    return {
+        "instructions": template_text(runtime.answer_prompt),
+        "question": question,
+        "query": sql,
+        "result": combined["result"],
+    }
+
+
+def measure_prompt_tokens(runtime: AgentRuntime, prompt) -> int:
+    # One real call with a single completion token reports the model's own
+    # prompt token count.
+    response = runtime.llm.bind(max_tokens=1).invoke(prompt)
+    return (response.usage_metadata or {}).get("input_tokens", 0)
+
+
+def profile(runtime: AgentRuntime, cases, count_tokens, measure=False):
+    profiles = {"reasoning": [], "answer": []}
+    for case in cases:
+        prompts = [("reasoning", reasoning_components(runtime, case["question"]))]
+        if case.get("sql"):
+            components = answer_components(runtime, case["question"], case["sql"])
+            if components is not None:
+                prompts.append(("answer", components))
+        for kind, components in prompts:
+            counts = {name: count_tokens(text) for name, text in components.items()}
+            record = {"id": case.get("id"), "components": counts, "estimated_total": sum(counts.values())}
+            if measure:
+                if kind == "reasoning":
+                    prompt = runtime.build_reasoning_prompt(initial_state(case["question"]))
+                else:
+                    prompt = runtime.build_answer_prompt({"question": components["question"],
+                                                          "query": components["query"],
+                                                          "result": components["result"]})
+                record["measured_total"] = measure_prompt_tokens(runtime, prompt)
+            profiles[kind].append(record)
+    return profiles
+
+
+def summarize(records) -> dict:
+    if not records:
+        return {}
+    totals = [record.get("measured_total") or record["estimated_total"] for record in records]
+    estimated = sum(record["estimated_total"] for record in records)
+    summary = {"prompts": len(records), "mean_total": statistics.mean(totals), "max_total": max(totals),
+               "components": {}}
+    for name in records[0]["components"]:
+        values = [record["components"][name] for record in records]
+        summary["components"][name] = {
+            "mean": statistics.mean(values),
+            "max": max(values),
+            "share": sum(values) / estimated if estimated else 0.0,
+        }
+    return summary
+
+
+def print_report(summaries, method):
+    print(f"Token counts: {method}")
+    for kind, summary in summaries.items():
+        if not summary:
+            continue
+        print(f"\n{kind} prompt: {summary['prompts']} prompts, mean {summary['mean_total']:.0f} tokens, "
+              f"max {summary['max_total']}")
+        for name, stats in sorted(summary["components"].items(), key=lambda item: -item[1]["share"]):
+            print(f"  {name:<14} mean {stats['mean']:>7.0f}  max {stats['max']:>6}  {stats['share']:>6.1%}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Break the agent's prompts down into token counts per component.")
+    parser.add_argument('--cases', default='benchmarks/golden_questions.jsonl',
+                        help='JSONL file with a "question" and optionally its reference "sql" per line')
+    parser.add_argument('-q', '--question', action='append', default=[],
+                        help='Profile this question instead of the cases file (repeatable)')
+    parser.add_argument('--measure', action='store_true',
+                        help='Also send each prompt to the model once to record its exact prompt token count')
+    parser.add_argument('-o', '--output', help='Write the per-prompt and summary figures as JSON to this file')
+    args = parser.parse_args()
+
+    if args.question:
+        cases = [{"id": i, "question": question} for i, question in enumerate(args.question)]
+    else:
+        with open(args.cases) as f:
+            cases = [json.loads(line) for line in f if line.strip()]
+
+    runtime = AgentRuntime()
+    if args.measure and not runtime.ollama.ensure_ready():
+        print(f"Ollama is not ready: {runtime.ollama.error}", file=sys.stderr)
+        sys.exit(1)
+
+    count_tokens = TokenCounter()
+    profiles = profile(runtime, cases, count_tokens, measure=args.measure)
+    summaries = {kind: summarize(records) for kind, records in profiles.items()}
+    print_report(summaries, count_tokens.method)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({"token_counts": count_tokens.method, "summary": summaries, "prompts": profiles},
+                      f, indent=2, default=str)
@@ -0,0 +1,224 @@
+import math
+import os
+import re
+from collections import Counter
+
+PROMPT_MAX_ROWS = int(os.getenv('RESULT_PROMPT_MAX_ROWS', '20'))
+PROMPT_MAX_BYTES = int(os.getenv('RESULT_PROMPT_MAX_BYTES', '4000'))
+UI_MAX_ROWS = int(os.getenv('RESULT_UI_MAX_ROWS', '5000'))
+# Answers the result can speak for without the model: 'off', 'scalar'
+# (one value per query) or 'small' (also single rows and short top-k lists).
+ANSWER_FAST_PATH = os.getenv('ANSWER_FAST_PATH', 'small')
+ANSWER_MAX_ROWS = int(os.getenv('ANSWER_FAST_PATH_MAX_ROWS', '10'))
+ANSWER_MAX_COLUMNS = int(os.getenv('ANSWER_FAST_PATH_MAX_COLUMNS', '4'))
+# Questions asking for interpretation rather than values always go to the model.
+EXPLANATION_WORDS = re.compile(
+    r'\b(why|explain|describe|compare|comparison|difference|trend|summari[sz]e|analy[sz]e|insight|interpret)',
+    re.IGNORECASE,
+)
+# Failures the user should see as-is rather than have the model explain.
+BUDGET_ERRORS = {'timeout', 'cancelled', 'row_limit'}
+SAMPLE_ROWS = 5
+TOP_K = 5
+# Cap on distinct values counted per text column, so a column of unique ids
+# cannot grow the counter to the size of the result.
+MAX_TRACKED_VALUES = 10000
+
+
+def format_rows(rows) -> str:
+    return str(rows) if rows else ""
+
+
+def _format_number(value) -> str:
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return str(value)
+
+
+class ColumnSummary:
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.nulls = 0
+        self.numeric = 0
+        self.minimum = None
+        self.maximum = None
+        self.total = 0.0
+        self.values = Counter()
+        self.values_capped = False
+
+    def add(self, value):
+        if value is None:
+            self.nulls += 1
+            return
+        self.count += 1
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            self.numeric += 1
+            self.total += value
+            if self.minimum is None or value < self.minimum:
+                self.minimum = value
+            if self.maximum is None or value > self.maximum:
+                self.maximum = value
+        key = str(value)
+        if key in self.values or len(self.values) < MAX_TRACKED_VALUES:
+            self.values[key] += 1
+        else:
+            self.values_capped = True
+
+    def is_numeric(self) -> bool:
+        return self.count > 0 and self.numeric == self.count
+
+    def to_dict(self) -> dict:
+        summary = {"column": self.name, "count": self.count, "nulls": self.nulls}
+        if self.is_numeric():
+            summary.update({
+                "min": self.minimum,
+                "max": self.maximum,
+                "mean": self.total / self.count,
+            })
+        else:
+            summary.update({
+                "distinct": len(self.values),
+                "distinct_capped": self.values_capped,
+                "top": self.values.most_common(TOP_K),
+            })
+        return summary
+
+    def describe(self) -> str:
+        if self.count == 0:
+            return f"- {self.name}: all {self.nulls} values are NULL"
+        if self.is_numeric():
+            mean = self.total / self.count
+            return (f"- {self.name}: min {_format_number(self.minimum)}, "
+                    f"max {_format_number(self.maximum)}, mean {mean:.2f}")
+        distinct = f"{len(self.values)}{'+' if self.values_capped else ''}"
+        top = ", ".join(f"{value} ({n})" for value, n in self.values.most_common(TOP_K))
+        return f"- {self.name}: {distinct} distinct values; most common: {top}"
+
+
+def render_for_prompt(columns, rows, row_count, summaries) -> str:
+    if row_count <= PROMPT_MAX_ROWS:
+        text = format_rows(rows)
+        if len(text) <= PROMPT_MAX_BYTES:
+            return text
+    lines = [
+        f"{row_count} rows returned with columns: {', '.join(columns)}.",
+        f"First {min(SAMPLE_ROWS, len(rows))} rows: {format_rows(rows[:SAMPLE_ROWS])}",
+        "Column summaries computed over all rows:",
+    ]
+    lines.extend(summary.describe() for summary in summaries)
+    text = "\n".join(lines)
+    if len(text) > PROMPT_MAX_BYTES:
+        text = text[:PROMPT_MAX_BYTES] + "\n[summary truncated]"
+    return text
+
+
+def materialize(batches) -> dict:
+    columns = []
+    rows = []
+    row_count = 0
+    summaries = None
+    for columns, batch in batches:
+        if summaries is None:
+            summaries = [ColumnSummary(name) for name in columns]
+        for row in batch:
+            row_count += 1
+            for summary, value in zip(summaries, row):
+                summary.add(value)
+            if len(rows) < UI_MAX_ROWS:
+                rows.append(row)
+    summaries = summaries or []
+    prompt_text = render_for_prompt(columns, rows, row_count, summaries)
+    return {
+        "columns": columns,
+        "rows": rows,
+        "row_count": row_count,
+        "truncated": row_count > len(rows),
+        "summary": [summary.to_dict() for summary in summaries],
+        "prompt_text": prompt_text,
+        "approx_bytes": len(repr(rows)) + len(prompt_text),
+    }
+
+
+def _answer_value(value) -> str:
+    if value is None:
+        return "none"
+    if isinstance(value, bool):
+        return "yes" if value else "no"
+    if isinstance(value, int):
+        return f"{value:,}"
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            return str(value)
+        if value == int(value):
+            return f"{int(value):,}"
+        # Two decimals for ordinary magnitudes; significant digits below 1 so
+        # 0.004 does not round to 0.
+        if abs(value) >= 1:
+            return f"{value:,.2f}".rstrip('0').rstrip('.')
+        return f"{value:.3g}"
+    return str(value)
+
+
+AGGREGATE_LABELS = {"count": "Count", "sum": "Total", "avg": "Average", "min": "Min", "max": "Max"}
+AGGREGATE_COLUMN = re.compile(r'(\w+)\(\s*(?:distinct\s+)?([\w.*"`\[\]]*)\s*\)', re.IGNORECASE)
+
+
+def _answer_label(column: str):
+    # Unaliased aggregates are labelled from the expression (MAX(wins) ->
+    # "Max wins"); other expressions have no usable label and get None.
+    aggregate = AGGREGATE_COLUMN.fullmatch((column or '').strip())
+    if aggregate and aggregate.group(1).lower() in AGGREGATE_LABELS:
+        name = AGGREGATE_LABELS[aggregate.group(1).lower()]
+        argument = aggregate.group(2).split('.')[-1].strip('"`[]')
+        return name if argument in ('', '*') else f"{name} {_answer_label(argument) or argument}".capitalize()
+    if not re.fullmatch(r'[A-Za-z_][A-Za-z0-9_]*', column or ''):
+        return None
+    words = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', column).replace('_', ' ').split()
+    return " ".join(words).capitalize()
+
+
+def _format_result_answer(result: dict, policy: str):
+    if result.get("kind") in BUDGET_ERRORS:
+        return result["error"]
+    if "error" in result or result.get("truncated"):
+        return None
+    columns, rows = result["columns"], result["rows"]
+    if not rows:
+        return "No matching rows were found."
+    if len(rows) == 1 and len(columns) == 1:
+        return f"{_answer_label(columns[0]) or 'Result'}: {_answer_value(rows[0][0])}"
+    if policy != 'small' or len(rows) > ANSWER_MAX_ROWS or len(columns) > ANSWER_MAX_COLUMNS:
+        return None
+    labels = [_answer_label(column) for column in columns]
+    # Values the user could not tell apart go to the model instead.
+    if labels.count(None) > 1 or len(set(labels)) < len(labels):
+        return None
+    labels = [label or "Result" for label in labels]
+    if len(rows) == 1:
+        return "\n".join(f"- {label}: {_answer_value(value)}" for label, value in zip(labels, rows[0]))
+    lines = []
+    for i, row in enumerate(rows, 1):
+        values = [_answer_value(value) for value in row]
+        if len(values) == 1:
+            lines.append(f"{i}. {values[0]}")
+        else:
+            details = ", ".join(f"{label}: {value}" for label, value in zip(labels[1:], values[1:]))
+            lines.append(f"{i}. {values[0]} ({details})")
+    return "\n".join(lines)
+
+
+def format_answer(question: str, results, policy: str = None):
+    """Deterministic answer for results that need no explanation, else None."""
+    policy = policy or ANSWER_FAST_PATH
+    if policy == 'off' or not results or EXPLANATION_WORDS.search(question or ""):
+        return None
+    parts = []
+    for result in results:
+        part = _format_result_answer(result, policy)
+        if part is None:
+            return None
+        parts.append(part)
+    if len(parts) == 1:
+        return parts[0]
+    return "\n\n".join(f"Query {i}:\n{part}" for i, part in enumerate(parts, 1))
@@ -0,0 +1,156 @@
+import os
+import re
+import threading
+
+from sqlalchemy import inspect
+
+from caching import DatabaseWatcher
+
+PRUNING_ENABLED = os.getenv('SCHEMA_PRUNING', '1') == '1'
+MIN_CONFIDENCE = float(os.getenv('SCHEMA_MIN_CONFIDENCE', '0.5'))
+# Tables this narrow are shown whole; pruning only pays off on wide ones.
+FULL_TABLE_COLUMNS = int(os.getenv('SCHEMA_FULL_TABLE_COLUMNS', '15'))
+SAMPLE_ROWS = 3
+
+STOPWORDS = {
+    'a', 'about', 'above', 'after', 'all', 'an', 'and', 'any', 'are', 'as', 'at', 'average', 'be',
+    'below', 'between', 'by', 'can', 'count', 'do', 'doe', 'each', 'every', 'few', 'fewer', 'for',
+    'from', 'get', 'give', 'greater', 'has', 'have', 'highest', 'how', 'i', 'in', 'is', 'it',
+    'least', 'less', 'list', 'lowest', 'many', 'max', 'maximum', 'me', 'mean', 'min', 'minimum',
+    'more', 'most', 'much', 'number', 'of', 'on', 'or', 'over', 'per', 'show', 'than', 'that', 'the',
+    'their', 'them', 'there', 'these', 'this', 'those', 'to', 'top', 'total', 'under', 'what', 'when',
+    'where', 'which', 'who', 'whose', 'with', 'without', 'was', 'were', 'bottom', 'best', 'worst',
+    'sum', 'tell', 'find', 'percent', 'percentage',
+}
+
+SYNONYMS = {
+    'winrate': ['win', 'loss'],
+    'rate': ['win', 'loss'],
+    'game': ['win', 'loss'],
+    'played': ['win', 'loss'],
+    'lp': ['league', 'point'],
+    'tier': ['rank', 'tier'],
+    'division': ['rank'],
+    'challenger': ['tier', 'rank'],
+    'grandmaster': ['tier', 'rank'],
+    'master': ['tier', 'rank'],
+    'new': ['fresh'],
+    'newcomer': ['fresh'],
+    'streak': ['hot', 'streak'],
+    'account': ['puuid', 'summoner'],
+}
+
+KEY_COLUMN_PATTERN = re.compile(r'(^|_)id$|Id$|^puuid$', re.IGNORECASE)
+
+
+def stem(token: str) -> str:
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith('es') and token[-3] in 'sxz':
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def identifier_tokens(name: str):
+    words = re.sub(r'([a-z0-9])([A-Z])', r'\1 \2', name).replace('_', ' ').lower().split()
+    tokens = {stem(word) for word in words}
+    tokens.add(stem(name.lower()))
+    return tokens
+
+
+def question_tokens(question: str):
+    tokens = [stem(word.lower()) for word in re.findall(r'[a-zA-Z][a-zA-Z0-9_]*', question)]
+    return [token for token in tokens if token not in STOPWORDS]
+
+
+class SchemaIndex:
+    def __init__(self, connections, watcher: DatabaseWatcher):
+        self.connections = connections
+        self.watcher = watcher
+        self._schema_version = None
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def _refresh(self):
+        schema_version = self.watcher.schema_version()
+        if schema_version == self._schema_version:
+            return
+        inspector = inspect(self.connections.engine)
+        tables = {}
+        for table in inspector.get_table_names():
+            columns = [(column['name'], str(column['type'])) for column in inspector.get_columns(table)]
+            tables[table] = {
+                "tokens": identifier_tokens(table),
+                "columns": columns,
+                "column_tokens": {name: identifier_tokens(name) for name, _ in columns},
+            }
+        self._tables = tables
+        self._schema_version = schema_version
+
+    def select(self, question: str):
+        with self._lock:
+            self._refresh()
+            tables = self._tables
+        tokens = question_tokens(question)
+        if not tokens or not tables:
+            return None, 0.0
+
+        matched_tokens = set()
+        selection = {}
+        for table, entry in tables.items():
+            table_hit = False
+            matched_columns = []
+            for token in tokens:
+                expanded = [token] + SYNONYMS.get(token, [])
+                if any(word in entry["tokens"] for word in expanded):
+                    table_hit = True
+                    matched_tokens.add(token)
+                for name, column_tokens in entry["column_tokens"].items():
+                    if any(word in column_tokens for word in expanded):
+                        matched_tokens.add(token)
+                        if name not in matched_columns:
+                            matched_columns.append(name)
+            if not table_hit and not matched_columns:
+                continue
+            all_columns = [name for name, _ in entry["columns"]]
+            if len(all_columns) <= FULL_TABLE_COLUMNS:
+                selection[table] = all_columns
+            else:
+                keep = {name for name in all_columns if KEY_COLUMN_PATTERN.search(name)}
+                keep.update(matched_columns)
+                selection[table] = [name for name in all_columns if name in keep]
+
+        confidence = len(matched_tokens) / len(set(tokens))
+        if not selection or confidence < MIN_CONFIDENCE:
+            return None, confidence
+        return selection, confidence
+
+    def describe(self, selection: dict) -> str:
+        with self._lock:
+            tables = self._tables
+        quote = self.connections.engine.dialect.identifier_preparer.quote
+        parts = []
+        with self.connections.connect() as conn:
+            for table, columns in selection.items():
+                types = dict(tables[table]["columns"])
+                column_lines = ",\n\t".join(f"{quote(name)} {types[name]}" for name in columns)
+                description = f"\nCREATE TABLE {quote(table)} (\n\t{column_lines}\n)\n"
+                select_list = ", ".join(quote(name) for name in columns)
+                if self.connections.dialect == 'mssql':
+                    sample_query = f"SELECT TOP {SAMPLE_ROWS} {select_list} FROM {quote(table)}"
+                else:
+                    sample_query = f"SELECT {select_list} FROM {quote(table)} LIMIT {SAMPLE_ROWS}"
+                try:
+                    rows = conn.exec_driver_sql(sample_query).fetchall()
+                    sample = "\n".join("\t".join(str(value)[:100] for value in row) for row in rows)
+                    description += (f"\n/*\n{SAMPLE_ROWS} rows from {table} table:\n"
+                                    f"{chr(9).join(columns)}\n{sample}\n*/\n")
+                except Exception:
+                    pass
+                parts.append(description)
+        omitted = [table for table in tables if table not in selection]
+        if omitted or any(len(cols) < len(tables[t]["columns"]) for t, cols in selection.items()):
+            parts.append("(Only the tables and columns relevant to this question are shown.)")
+        return "".join(parts)
@@ -0,0 +1,258 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from chat import AgentRuntime
+from metrics import metrics
+from pipeline import CancelToken
+
+SERVER_CONCURRENCY = int(os.getenv('SERVER_CONCURRENCY', '4'))
+SERVER_QUEUE_SIZE = int(os.getenv('SERVER_QUEUE_SIZE', '16'))
+SERVER_DEADLINE = float(os.getenv('SERVER_DEADLINE', '120'))
+MAX_BODY_BYTES = 64 * 1024
+
+
+class Saturated(Exception):
+    pass
+
+
+class AdmissionControl:
+    """At most `concurrency` questions run at once and at most `queue_size` wait.
+
+    Anything beyond that is turned away immediately instead of piling up
+    threads behind the model server.
+    """
+
+    def __init__(self, concurrency: int, queue_size: int):
+        self.concurrency = concurrency
+        self.queue_size = queue_size
+        self.running = 0
+        self.waiting = 0
+        self._slots = threading.Condition()
+
+    def acquire(self, deadline: float) -> bool:
+        with self._slots:
+            if self.running >= self.concurrency and self.waiting >= self.queue_size:
+                raise Saturated(f"{self.running} running and {self.waiting} queued")
+            self.waiting += 1
+            try:
+                while self.running >= self.concurrency:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    self._slots.wait(remaining)
+                self.running += 1
+                return True
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self._slots:
+            self.running -= 1
+            self._slots.notify()
+
+    def stats(self) -> dict:
+        with self._slots:
+            return {"running": self.running, "queued": self.waiting,
+                    "concurrency": self.concurrency, "queue_size": self.queue_size}
+
+
+def stopped_reason(deadline: float):
+    # Status label and message for a run that ended without an answer.
+    if time.monotonic() >= deadline:
+        return "deadline", "Deadline exceeded"
+    return "cancelled", "Cancelled"
+
+
+class AgentRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 so streamed answers can use chunked transfer encoding.
+    protocol_version = "HTTP/1.1"
+    server_version = "text2sql"
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, body: dict, headers=None):
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def write_chunk(self, event: dict):
+        data = (json.dumps(event, default=str) + "\n").encode()
+        self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path == "/healthz":
+            self.send_json(HTTPStatus.OK, {"status": "ok", **self.server.admission.stats()})
+        elif self.path == "/metrics":
+            data = metrics.prometheus_text().encode()
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        else:
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {self.path}"})
+
+    def read_request(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length > MAX_BODY_BYTES:
+            raise ValueError("Request body too large")
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("Request body must be a JSON object")
+        question = str(body.get("question", "")).strip()
+        if not question:
+            raise ValueError('Request needs a non-empty "question"')
+        timeout = min(float(body.get("timeout", self.server.deadline)), self.server.deadline)
+        return question, timeout, bool(body.get("stream", False))
+
+    def do_POST(self):
+        if self.path != "/ask":
+            self.send_json(HTTPStatus.NOT_FOUND, {"error": f"Unknown path {self.path}"})
+            return
+        try:
+            question, timeout, stream = self.read_request()
+        except (ValueError, TypeError) as e:
+            self.send_json(HTTPStatus.BAD_REQUEST, {"error": str(e)})
+            return
+
+        started = time.monotonic()
+        deadline = started + timeout
+        admission = self.server.admission
+        try:
+            admitted = admission.acquire(deadline)
+        except Saturated as e:
+            metrics.increment("agent_server_requests_total", status="rejected")
+            self.send_json(HTTPStatus.TOO_MANY_REQUESTS, {"error": f"Server is saturated: {e}"},
+                           headers={"Retry-After": "1"})
+            return
+        metrics.observe("agent_server_queue_seconds", time.monotonic() - started)
+        if not admitted:
+            metrics.increment("agent_server_requests_total", status="deadline")
+            self.send_json(HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Deadline exceeded while queued"})
+            return
+
+        # The deadline cancels the token, which interrupts the running
+        # statement and stops the graph before its next step.
+        cancel_token = CancelToken()
+        timer = threading.Timer(max(0.0, deadline - time.monotonic()), cancel_token.cancel)
+        timer.daemon = True
+        timer.start()
+        try:
+            if stream:
+                status = self.answer_streaming(question, cancel_token, deadline)
+            else:
+                status = self.answer(question, cancel_token, deadline)
+        finally:
+            timer.cancel()
+            admission.release()
+        metrics.increment("agent_server_requests_total", status=status)
+        metrics.observe("agent_server_request_seconds", time.monotonic() - started)
+
+    def answer(self, question: str, cancel_token: CancelToken, deadline: float) -> str:
+        state = {"question": question}
+        try:
+            for event in self.server.runtime.stream(question, cancel_token):
+                if event["type"] == "step":
+                    state.update(event["payload"])
+        except Exception as e:
+            self.send_json(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": f"{type(e).__name__}: {e}"})
+            return "error"
+        if "answer" not in state:
+            status, error = stopped_reason(deadline)
+            self.send_json(HTTPStatus.GATEWAY_TIMEOUT, {"error": error, "partial": state})
+            return status
+        self.send_json(HTTPStatus.OK, {
+            "question": question,
+            "query": state.get("query"),
+            "result": state.get("result"),
+            "results": state.get("results", []),
+            "answer": state.get("answer"),
+        })
+        return "ok"
+
+    def answer_streaming(self, question: str, cancel_token: CancelToken, deadline: float) -> str:
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        status = "ok"
+        try:
+            try:
+                finished = False
+                for event in self.server.runtime.stream(question, cancel_token):
+                    self.write_chunk(event)
+                    finished = event["type"] == "step" and event["node"] == "generate_final_answer"
+                if not finished:
+                    status, error = stopped_reason(deadline)
+                    self.write_chunk({"type": "error", "error": error})
+            except (BrokenPipeError, ConnectionResetError):
+                # The client went away; stop spending model and DB time on it.
+                cancel_token.cancel()
+                self.close_connection = True
+                return "disconnected"
+            except Exception as e:
+                status = "error"
+                self.write_chunk({"type": "error", "error": f"{type(e).__name__}: {e}"})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+            return "disconnected"
+        return status
+
+
+class AgentServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, runtime: AgentRuntime, concurrency: int = SERVER_CONCURRENCY,
+                 queue_size: int = SERVER_QUEUE_SIZE, deadline: float = SERVER_DEADLINE, quiet: bool = False):
+        super().__init__(address, AgentRequestHandler)
+        self.runtime = runtime
+        self.admission = AdmissionControl(concurrency, queue_size)
+        self.deadline = deadline
+        self.quiet = quiet
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Serve the ReAct SQL agent over HTTP.")
+    parser.add_argument('--host', default='127.0.0.1', help='Address to bind')
+    parser.add_argument('--port', type=int, default=8000, help='Port to listen on')
+    parser.add_argument('-c', '--concurrency', type=int, default=SERVER_CONCURRENCY,
+                        help='Maximum number of questions answered at once')
+    parser.add_argument('-q', '--queue-size', type=int, default=SERVER_QUEUE_SIZE,
+                        help='Maximum number of questions waiting for a slot before requests get 429')
+    parser.add_argument('--deadline', type=float, default=SERVER_DEADLINE,
+                        help='Longest time in seconds a request may take, queueing included')
+    parser.add_argument('--quiet', action='store_true', help='Do not log each request')
+    args = parser.parse_args()
+
+    concurrency = max(1, args.concurrency)
+    runtime = AgentRuntime(sessions=concurrency)
+    if not runtime.ollama.ensure_ready():
+        print(f"Ollama is not ready: {runtime.ollama.error}", file=sys.stderr)
+        sys.exit(1)
+
+    server = AgentServer((args.host, args.port), runtime, concurrency=concurrency,
+                         queue_size=max(0, args.queue_size), deadline=args.deadline, quiet=args.quiet)
+    print(f"Serving on http://{args.host}:{args.port} "
+          f"(concurrency {concurrency}, queue {args.queue_size}, deadline {args.deadline:.0f}s)", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        runtime.close()
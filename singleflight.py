@@ -0,0 +1,253 @@
+import asyncio
+import os
+import re
+import threading
+
+from metrics import metrics
+from pipeline import CancelToken
+
+COALESCING_ENABLED = os.getenv('COALESCE_QUESTIONS', '1') == '1'
+
+
+def cancelled_event(last=None) -> dict:
+    # What a subscriber that stopped following sees last, like a cancelled run's own event.
+    return {"type": "cancelled", "node": last["node"] if last else None, "payload": {},
+            "elapsed": 0.0, "total": last["total"] if last else 0.0}
+
+
+def coalesce_key(question: str) -> str:
+    # Unlike the template cache, numbers are kept: only questions that would
+    # produce the same SQL share a run.
+    return re.sub(r'\s+', ' ', question.strip().lower()).rstrip('?.! ')
+
+
+class Flight:
+    """One run of the agent, replayed to every caller that asked the same question."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.cancel_token = CancelToken()
+        self._changed = threading.Condition()
+
+    def publish(self, event):
+        with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    def finish(self, error=None):
+        with self._changed:
+            self.done = True
+            self.error = error
+            self._changed.notify_all()
+
+    def wake(self):
+        with self._changed:
+            self._changed.notify_all()
+
+    def follow(self, cancel_token: CancelToken = None, leave=None):
+        # Late subscribers first replay what already happened, then wait for
+        # the rest. A cancelled subscriber stops following but not the flight,
+        # unless `leave()` reports it was the last one: the flight is then
+        # cancelled too, and its own final events are still delivered.
+        unregister = cancel_token.register(self.wake) if cancel_token is not None else None
+        index = 0
+        last = None
+        watching = cancel_token is not None
+        try:
+            while True:
+                with self._changed:
+                    while index >= len(self.events) and not self.done and not (watching and cancel_token.cancelled):
+                        self._changed.wait()
+                    detached = watching and cancel_token.cancelled
+                    if not detached:
+                        pending = self.events[index:]
+                        index += len(pending)
+                        finished = self.done and index >= len(self.events)
+                if detached:
+                    watching = False
+                    if leave is not None and leave():
+                        continue
+                    break
+                for last in pending:
+                    yield last
+                if finished:
+                    if self.error is not None:
+                        raise self.error
+                    return
+        finally:
+            if unregister is not None:
+                unregister()
+        if last is None or last["type"] != "cancelled":
+            yield cancelled_event(last)
+
+
+class AsyncFlight:
+    """Flight for one event loop: the run is a task and subscribers await its events."""
+
+    def __init__(self):
+        self.events = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.cancel_token = CancelToken()
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        # Waiters hold on to the event they saw, so swapping in a fresh one
+        # wakes all of them without a shared clear().
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    def publish(self, event):
+        self.events.append(event)
+        self.notify()
+
+    def finish(self, error=None):
+        self.done = True
+        self.error = error
+        self.notify()
+
+    async def follow(self, cancel_token: CancelToken = None, leave=None):
+        unregister = None
+        if cancel_token is not None:
+            loop = asyncio.get_running_loop()
+            unregister = cancel_token.register(lambda: loop.call_soon_threadsafe(self.notify))
+        index = 0
+        last = None
+        watching = cancel_token is not None
+        try:
+            while True:
+                if watching and cancel_token.cancelled:
+                    watching = False
+                    if leave is not None and leave():
+                        continue
+                    if last is None or last["type"] != "cancelled":
+                        yield cancelled_event(last)
+                    return
+                if index < len(self.events):
+                    last = self.events[index]
+                    index += 1
+                    yield last
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                await self._changed.wait()
+        finally:
+            if unregister is not None:
+                unregister()
+
+
+class SingleFlight:
+    """Runs identical concurrent questions once and shares the events.
+
+    `run(question, cancel_token)` and `arun(question, cancel_token)` produce
+    the events. A flight is cancelled only once every subscriber has gone.
+    """
+
+    def __init__(self, run, arun, enabled: bool = COALESCING_ENABLED):
+        self.run = run
+        self.arun = arun
+        self.enabled = enabled
+        self._flights = {}
+        self._async_flights = {}
+        self._lock = threading.Lock()
+
+    def _join(self, flights, key, new_flight):
+        with self._lock:
+            flight = flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = flights[key] = new_flight()
+            flight.subscribers += 1
+        if not leader:
+            metrics.increment("agent_coalesced_requests_total")
+        return flight, leader
+
+    def _leave(self, flights, key, flight) -> bool:
+        # True when this was the last subscriber and the flight is cancelled.
+        with self._lock:
+            flight.subscribers -= 1
+            abandoned = flight.subscribers == 0 and not flight.done
+            if abandoned and flights.get(key) is flight:
+                del flights[key]
+        if abandoned:
+            flight.cancel_token.cancel()
+        return abandoned
+
+    def _subscription(self, flights, key, flight):
+        # leave() for follow(); later calls, and the one in stream()'s
+        # cleanup after follow() already left, do nothing.
+        left = []
+
+        def leave():
+            if left:
+                return False
+            left.append(True)
+            return self._leave(flights, key, flight)
+        return leave
+
+    def _land(self, flights, key, flight):
+        with self._lock:
+            if flights.get(key) is flight:
+                del flights[key]
+
+    def _fly(self, key, flight, question):
+        error = None
+        try:
+            for event in self.run(question, flight.cancel_token):
+                flight.publish(event)
+        except Exception as e:
+            error = e
+        finally:
+            self._land(self._flights, key, flight)
+            flight.finish(error)
+
+    async def _afly(self, key, flight, question):
+        error = None
+        try:
+            async for event in self.arun(question, flight.cancel_token):
+                flight.publish(event)
+        except Exception as e:
+            error = e
+        finally:
+            self._land(self._async_flights, key, flight)
+            flight.finish(error)
+
+    def stream(self, question: str, cancel_token: CancelToken = None):
+        if not self.enabled:
+            yield from self.run(question, cancel_token)
+            return
+        key = coalesce_key(question)
+        flight, leader = self._join(self._flights, key, Flight)
+        if leader:
+            threading.Thread(target=self._fly, args=(key, flight, question),
+                             name="agent-flight", daemon=True).start()
+        leave = self._subscription(self._flights, key, flight)
+        try:
+            yield from flight.follow(cancel_token, leave)
+        finally:
+            leave()
+
+    async def astream(self, question: str, cancel_token: CancelToken = None):
+        if not self.enabled:
+            async for event in self.arun(question, cancel_token):
+                yield event
+            return
+        # Async flights are keyed per event loop; their tasks cannot be awaited
+        # from another loop.
+        key = (id(asyncio.get_running_loop()), coalesce_key(question))
+        flight, leader = self._join(self._async_flights, key, AsyncFlight)
+        if leader:
+            flight.task = asyncio.create_task(self._afly(key, flight, question))
+        leave = self._subscription(self._async_flights, key, flight)
+        try:
+            async for event in flight.follow(cancel_token, leave):
+                yield event
+        finally:
+            leave()
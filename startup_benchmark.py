@@ -0,0 +1,73 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Modules `import chat` must not load; they belong to the first runtime.
+DEFERRED_MODULES = ["langchain_openai", "openai", "langchain_community", "langgraph", "langsmith", "httpx",
+                    "psycopg2", "mysql", "pyodbc"]
+
+
+def measure_once(question: str) -> dict:
+    # Runs in a fresh interpreter so nothing is already imported or cached.
+    started = time.perf_counter()
+    import chat
+    imported = time.perf_counter()
+    loaded = [name for name in DEFERRED_MODULES if name in sys.modules]
+    runtime = chat.AgentRuntime()
+    built = time.perf_counter()
+    runtime.build_reasoning_prompt(chat.initial_state(question))
+    ready = time.perf_counter()
+    return {
+        "import": imported - started,
+        "runtime": built - imported,
+        "first_prompt": ready - built,
+        "total": ready - started,
+        "eager_modules": loaded,
+    }
+
+
+def run_child(question: str) -> dict:
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", "--question", question],
+        capture_output=True, text=True, check=True, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Time importing the agent and getting it ready for a first question.")
+    parser.add_argument('-n', '--runs', type=int, default=5, help='Fresh interpreters to time')
+    parser.add_argument('--budget', type=float, default=float(os.getenv('STARTUP_BUDGET', '5.0')),
+                        help='Fail when the median import-to-ready time exceeds this many seconds')
+    parser.add_argument('--import-budget', type=float, default=float(os.getenv('STARTUP_IMPORT_BUDGET', '1.0')),
+                        help='Fail when the median time to import chat exceeds this many seconds')
+    parser.add_argument('--question', default='Top 10 players by leaguePoints',
+                        help='Question whose reasoning prompt marks the agent as ready')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure_once(args.question)))
+        sys.exit(0)
+
+    runs = [run_child(args.question) for _ in range(max(1, args.runs))]
+    medians = {phase: statistics.median(run[phase] for run in runs)
+               for phase in ("import", "runtime", "first_prompt", "total")}
+    for phase, value in medians.items():
+        print(f"{phase:<13} median {value:.3f}s  max {max(run[phase] for run in runs):.3f}s")
+
+    failures = []
+    eager = sorted({name for run in runs for name in run["eager_modules"]})
+    if eager:
+        failures.append(f"import chat loaded deferred modules: {', '.join(eager)}")
+    if medians["import"] > args.import_budget:
+        failures.append(f"import took {medians['import']:.3f}s, budget {args.import_budget:.3f}s")
+    if medians["total"] > args.budget:
+        failures.append(f"import-to-ready took {medians['total']:.3f}s, budget {args.budget:.3f}s")
+    for failure in failures:
+        print(f"FAIL: {failure}", file=sys.stderr)
+    sys.exit(1 if failures else 0)
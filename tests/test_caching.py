@@ -0,0 +1,49 @@
+from caching import bind_template, build_template, normalize_question, normalize_sql
+
+
+def test_normalize_question_extracts_numbers():
+    text, values = normalize_question("  Players with winrate above 52% and more than 100 games?")
+    assert text == "players with winrate above {}% and more than {} games"
+    assert values == [52.0, 100.0]
+
+
+def test_template_binds_raw_and_percent_values():
+    _, values = normalize_question("Players with winrate above 52% and more than 100 games")
+    template = build_template(values, "SELECT * FROM t WHERE winrate_fraction > 0.52 AND total_games > 100")
+    assert template[1] == [(0, 'percent', '0.52'), (1, 'raw', '100')]
+    assert bind_template(template, [60.0, 250.0]) == "SELECT * FROM t WHERE winrate_fraction > 0.6 AND total_games > 250"
+    assert bind_template(template, [55.5, 10.0]) == "SELECT * FROM t WHERE winrate_fraction > 0.555 AND total_games > 10"
+
+
+def test_template_keeps_decimal_literals_decimal():
+    template = build_template([2.0], "SELECT * FROM t WHERE kda > 2.0")
+    assert bind_template(template, [3.0]) == "SELECT * FROM t WHERE kda > 3.0"
+
+
+def test_template_ignores_numbers_inside_string_literals():
+    template = build_template([5.0], "SELECT * FROM t WHERE name = '5' LIMIT 5")
+    assert bind_template(template, [8.0]) == "SELECT * FROM t WHERE name = '5' LIMIT 8"
+
+
+def test_template_rejects_value_that_reads_as_raw_and_percent():
+    # 0.5 is both the question's 0.5 and its 50%.
+    assert build_template([0.5, 50.0], "SELECT * FROM t WHERE x > 0.5") is None
+
+
+def test_template_rejects_value_used_twice():
+    # 1.0 is 100% of the question's 100 as well as the literal 100.
+    assert build_template([100.0], "SELECT wins * 1.0 / (wins + losses) FROM t WHERE wins > 100") is None
+
+
+def test_template_rejects_repeated_question_values():
+    assert build_template([10.0, 10.0], "SELECT * FROM t LIMIT 10") is None
+
+
+def test_template_rejects_question_value_missing_from_sql():
+    assert build_template([7.0], "SELECT * FROM t LIMIT 10") is None
+
+
+def test_normalize_sql_folds_case_and_whitespace_outside_literals():
+    assert normalize_sql("SELECT  *\n FROM T WHERE rank = 'I' ;") == "select * from t where rank = 'I'"
+    assert normalize_sql("SELECT * FROM t WHERE rank = 'I'") != normalize_sql("select * from t where rank = 'i'")
+    assert normalize_sql('SELECT "Wins" FROM t') == 'select "Wins" from t'
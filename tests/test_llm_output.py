@@ -0,0 +1,74 @@
+from llm_output import ThinkTagFilter, parse_reasoning_output
+
+
+def feed_all(chunks):
+    think_filter = ThinkTagFilter()
+    return "".join(think_filter.feed(chunk) for chunk in chunks) + think_filter.flush()
+
+
+def test_think_filter_hides_tags_split_across_chunks():
+    assert feed_all(["<thi", "nk>secret</th", "ink>  Hello", " world"]) == "Hello world"
+
+
+def test_think_filter_keeps_text_that_only_looks_like_a_tag():
+    assert feed_all(["a <", "b> c </", "x> d <"]) == "a <b> c </x> d <"
+
+
+def test_think_filter_drops_unclosed_thoughts():
+    assert feed_all(["Answer <think>still thinking", "..."]) == "Answer "
+
+
+def test_think_filter_drops_stray_closing_tag():
+    assert feed_all(["plan</think>", "\nAnswer"]) == "plan\nAnswer"
+
+
+def test_think_filter_single_characters():
+    assert feed_all(list("<think>x</think> Hi")) == "Hi"
+
+
+def test_parse_clean_json():
+    result, method = parse_reasoning_output('{"reasoning": "r", "query": "SELECT 1"}')
+    assert method == "json"
+    assert result == {"reasoning": "r", "query": "SELECT 1"}
+
+
+def test_parse_uses_think_text_as_reasoning():
+    result, method = parse_reasoning_output('<think>plan</think>{"query": "SELECT 1"}')
+    assert method == "json"
+    assert result == {"reasoning": "plan", "query": "SELECT 1"}
+
+
+def test_parse_repairs_python_literal_with_trailing_comma():
+    result, method = parse_reasoning_output("{'reasoning': 'r', 'query': 'SELECT 1',}")
+    assert method == "repaired_json"
+    assert result["query"] == "SELECT 1"
+
+
+def test_parse_repairs_smart_quotes_inside_prose():
+    result, method = parse_reasoning_output('Sure:\n{"reasoning": “x”, "query": "SELECT 1"}')
+    assert method == "repaired_json"
+    assert result == {"reasoning": "x", "query": "SELECT 1"}
+
+
+def test_parse_repairs_truncated_object():
+    result, method = parse_reasoning_output('{"reasoning": "x", "query": "SELECT * FROM t')
+    assert method == "repaired_json"
+    assert result["query"] == "SELECT * FROM t"
+
+
+def test_parse_falls_back_to_fenced_sql():
+    result, method = parse_reasoning_output("Here it is:\n```sql\nSELECT 1;\n```")
+    assert method == "fenced_sql"
+    assert result["query"] == "SELECT 1"
+
+
+def test_parse_bare_sql_skips_prose_starting_with_select():
+    result, method = parse_reasoning_output("Select the top players by LP.\n\nSELECT name FROM t LIMIT 5;")
+    assert method == "bare_sql"
+    assert result["query"] == "SELECT name FROM t LIMIT 5"
+
+
+def test_parse_reports_failure_without_query():
+    result, method = parse_reasoning_output("no query here")
+    assert method == "failed"
+    assert result["query"] == ""